@@ -4,6 +4,13 @@ set -a
 [ -f /app/.env ] && . /app/.env
 set +a
 
+# Metric files left by a previous run of this container would be summed
+# with the new processes' samples
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 if [ "$ENVIRONMENT" = "local" ]; then
   # Wait for PostgreSQL to be available
   until pg_isready -h $DJANGO_DB_HOST -p $DJANGO_DB_PORT -U $POSTGRES_USER; do
@@ -0,0 +1,151 @@
+import math
+import random
+import time
+import uuid
+from typing import Callable, Optional
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from core.metrics import record_cache_lookup
+
+MISSING = object()
+
+# Backends whose entries are only visible to the process that wrote them
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def cache_aside(
+    cache,
+    key: str,
+    compute: Callable,
+    timeout: float,
+    lock_timeout: float = 10,
+    max_wait: float = 2,
+    beta: float = 1.0,
+    label: Optional[str] = None,
+):
+    """
+    Return the cached value for ``key``, computing and storing it on a miss.
+
+    Notes:
+    - On a miss only the caller that wins a short lock computes; the rest
+    poll for its result for up to ``max_wait`` seconds before computing
+    themselves.
+    - Entries remember how long they took to compute and are refreshed
+    early, with a probability that rises as expiry nears (XFetch). The
+    early refresh is also behind the lock, so everyone else keeps being
+    served the current value meanwhile.
+    - ``None`` results are cached too.
+    - With a ``label`` the lookup is counted as a hit or a miss in the
+    cache metrics.
+    """
+    lock_key = f"{key}:lock"
+    entry = cache.get(key)
+    if label is not None:
+        record_cache_lookup(label, entry is not None)
+    if entry is not None:
+        value, delta, expires_at = entry
+        early = delta * beta * math.log(random.random())
+        if time.time() - early < expires_at:
+            return value
+        if not cache.add(lock_key, 1, lock_timeout):
+            return value
+    else:
+        deadline = time.monotonic() + max_wait
+        while not cache.add(lock_key, 1, lock_timeout):
+            if time.monotonic() >= deadline:
+                # The lock holder is too slow; don't hold the request up
+                return _compute_and_store(cache, key, compute, timeout)
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+
+    try:
+        return _compute_and_store(cache, key, compute, timeout)
+    finally:
+        cache.delete(lock_key)
+
+
+def _compute_and_store(cache, key, compute, timeout):
+    start = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - start
+    cache.set(key, (value, delta, time.time() + timeout), timeout)
+    return value
+
+
+class CacheNamespace:
+    """
+    Keys for one kind of cached data, laid out as
+    ``<name>:v<version>:<id>``.
+
+    Notes:
+    - Bump ``version`` whenever the shape of the cached values changes
+    (e.g. a model field is added), so entries written by older code are
+    never read back.
+    - A ``generational`` namespace also keys on a counter stored in the
+    cache, so ``invalidate_all`` drops every entry at once. Each access
+    then costs an extra cache read.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        version: int = 1,
+        generational: bool = False,
+        alias: str = DEFAULT_CACHE_ALIAS,
+    ):
+        self.name = name
+        self.version = version
+        self.generational = generational
+        self.alias = alias
+
+    @property
+    def prefix(self) -> str:
+        return f"{self.name}:v{self.version}"
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def shared(self) -> bool:
+        """Whether every process reads and writes the same entries."""
+        return not isinstance(self.cache, PROCESS_LOCAL_BACKENDS)
+
+    def key(self, ident) -> str:
+        if not self.generational:
+            return f"{self.prefix}:{ident}"
+        generation_key = f"{self.prefix}:generation"
+        generation = self.cache.get(generation_key)
+        if generation is None:
+            generation = uuid.uuid4().hex[:8]
+            # Another process may have set it first; use whatever won
+            if not self.cache.add(generation_key, generation, None):
+                generation = self.cache.get(generation_key, generation)
+        return f"{self.prefix}:{generation}:{ident}"
+
+    def get(self, ident, default=None):
+        value = self.cache.get(self.key(ident), MISSING)
+        record_cache_lookup(self.name, value is not MISSING)
+        return default if value is MISSING else value
+
+    def set(self, ident, value, timeout):
+        self.cache.set(self.key(ident), value, timeout)
+
+    def delete(self, ident):
+        self.cache.delete(self.key(ident))
+
+    def get_or_compute(self, ident, compute: Callable, timeout: float):
+        """Cache-aside lookup with stampede protection, see cache_aside."""
+        return cache_aside(
+            self.cache, self.key(ident), compute, timeout, label=self.name
+        )
+
+    def invalidate_all(self):
+        if not self.generational:
+            raise TypeError(f"{self.name} is not a generational namespace")
+        self.cache.set(f"{self.prefix}:generation", uuid.uuid4().hex[:8], None)
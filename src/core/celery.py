@@ -1,3 +1,4 @@
+import datetime
 import os
 
 from celery import Celery
@@ -10,7 +11,31 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 app.autodiscover_tasks()
 
+# Connects the task timing signal receivers
+import core.metrics  # noqa: E402, F401
+
 
 @app.task(bind=True)
 def debug_task(self):
     print(f"Request: {self.request!r}")
+
+
+@app.task(name="purge_task_results", acks_late=True)
+def purge_task_results(chunk_size=None):
+    """
+    Delete TaskResult rows older than CELERY_RESULT_EXPIRES in chunks,
+    instead of celery.backend_cleanup's single unbounded DELETE.
+    """
+    from django.conf import settings
+    from django.utils import timezone
+    from django_celery_results.models import TaskResult
+
+    from core.db.utils import delete_in_chunks
+
+    expires = app.conf.result_expires
+    if isinstance(expires, (int, float)):
+        expires = datetime.timedelta(seconds=expires)
+    expired = TaskResult.objects.filter(date_done__lt=timezone.now() - expires)
+    return delete_in_chunks(
+        expired, chunk_size or settings.CELERY_RESULT_PURGE_CHUNK_SIZE
+    )
@@ -0,0 +1,40 @@
+from functools import partial
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from django.utils.asyncio import async_unsafe
+
+from core.db.pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend that borrows connections from a bounded pool
+    shared by every thread of the process.
+
+    Closing the connection, which Django does at the end of each request
+    when CONN_MAX_AGE is 0, hands it back to the pool. The pool is
+    configured by the "POOL" key of the database settings.
+    """
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict.get("POOL", {}))
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        # The parent only resolves this for brand new connections
+        self.isolation_level = IsolationLevel(
+            self.settings_dict["OPTIONS"].get(
+                "isolation_level", IsolationLevel.READ_COMMITTED
+            )
+        )
+        return self.pool.getconn(
+            partial(super().get_new_connection, conn_params)
+        )
+
+    def _close(self):
+        # Django keeps its reference to a connection closed inside an
+        # atomic block, so it must not be handed to another thread.
+        with self.wrap_database_errors:
+            self.pool.putconn(self.connection, discard=self.in_atomic_block)
@@ -0,0 +1,280 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+from core import metrics
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """No connection was returned to a full pool within its timeout."""
+
+
+class PooledConnection:
+    __slots__ = ("connection", "created_at", "last_used")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = self.last_used = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of psycopg2 connections for one database.
+
+    Notes:
+    - At most `max_size` connections are open at once; callers beyond
+    that wait up to `timeout` seconds and then get a PoolTimeout.
+    - Connections older than `max_lifetime` or idle longer than
+    `max_idle` are closed instead of reused. One idle for more than
+    `check_interval` is pinged before it is handed out.
+    - A connection returned mid-transaction is rolled back; one in an
+    unknown state is discarded.
+    - In-use and idle connections, waits and timeouts are exported to
+    Prometheus under `alias`.
+    """
+
+    def __init__(
+        self,
+        alias="default",
+        max_size=10,
+        timeout=5.0,
+        max_lifetime=1800.0,
+        max_idle=300.0,
+        check_interval=30.0,
+    ):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = dict.fromkeys(
+            (
+                "checkouts",
+                "waits",
+                "timeouts",
+                "creations",
+                "discards",
+                "failed_health_checks",
+            ),
+            0,
+        )
+        self._wait_seconds = 0.0
+
+    def getconn(self, connect):
+        """
+        Check out a connection, calling `connect()` to open a new one
+        when the pool has room but nothing idle.
+        """
+        while True:
+            entry = self._reserve()
+            if entry is None:
+                connection = self._create(connect)
+                self._publish()
+                return connection
+            if self._is_healthy(entry):
+                with self._cond:
+                    self._stats["checkouts"] += 1
+                    self._in_use[id(entry.connection)] = entry
+                self._publish()
+                return entry.connection
+            self._discard(entry)
+
+    def putconn(self, connection, discard=False):
+        with self._cond:
+            entry = self._in_use.pop(id(connection), None)
+        if entry is None:
+            # Checked out before a fork reset; it is not ours to keep
+            connection.close()
+            return
+        if discard or not self._reset(entry):
+            self._discard(entry)
+            return
+
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+        self._publish()
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_quietly(entry.connection)
+        self._publish()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "wait_seconds": round(self._wait_seconds, 6),
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "max_size": self.max_size,
+            }
+
+    def _reserve(self):
+        """
+        Pop the most recently used idle connection, or return None once
+        a slot for a new connection has been reserved.
+        """
+        deadline = None
+        timed_out = False
+        try:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    now = time.monotonic()
+                    if deadline is None:
+                        self._stats["waits"] += 1
+                        started, deadline = now, now + self.timeout
+                    if now >= deadline:
+                        self._stats["timeouts"] += 1
+                        self._wait_seconds += now - started
+                        timed_out = True
+                        raise PoolTimeout(
+                            f"No database connection available within "
+                            f"{self.timeout}s ({self.max_size} in use)"
+                        )
+                    self._cond.wait(deadline - now)
+
+                if deadline is not None:
+                    self._wait_seconds += time.monotonic() - started
+                if self._idle:
+                    return self._idle.pop()
+                self._size += 1
+                return None
+        finally:
+            # Exported once the lock is released
+            if deadline is not None:
+                metrics.record_pool_wait(
+                    self.alias, time.monotonic() - started, timed_out
+                )
+
+    def _create(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        entry = PooledConnection(connection)
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["creations"] += 1
+            self._in_use[id(connection)] = entry
+        return connection
+
+    def _is_healthy(self, entry) -> bool:
+        now = time.monotonic()
+        if entry.connection.closed or self._expired(entry, now):
+            return False
+        if now - entry.last_used < self.check_interval:
+            return True
+
+        connection = entry.connection
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            with self._cond:
+                self._stats["failed_health_checks"] += 1
+            return False
+        return True
+
+    def _expired(self, entry, now) -> bool:
+        return (
+            now - entry.created_at > self.max_lifetime
+            or now - entry.last_used > self.max_idle
+        )
+
+    def _reset(self, entry) -> bool:
+        connection = entry.connection
+        if connection.closed:
+            return False
+        if time.monotonic() - entry.created_at > self.max_lifetime:
+            return False
+
+        status = connection.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _discard(self, entry):
+        self._close_quietly(entry.connection)
+        with self._cond:
+            self._size -= 1
+            self._stats["discards"] += 1
+            self._cond.notify()
+        self._publish()
+
+    def _publish(self):
+        # Racy without the lock, but only by the checkouts in flight
+        metrics.record_pool_connections(
+            self.alias, len(self._in_use), len(self._idle)
+        )
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+# Connections inherited across a fork. They are kept referenced so the
+# child never finalizes them, which would end the parent's sessions.
+_inherited = []
+
+
+def get_pool(alias: str, options: dict) -> ConnectionPool:
+    """Return the process-wide pool for a database alias."""
+    pool = _pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                pool = _pools[alias] = ConnectionPool(
+                    alias,
+                    **{key.lower(): value for key, value in options.items()},
+                )
+    return pool
+
+
+def close_pools():
+    for pool in list(_pools.values()):
+        pool.close()
+
+
+def _reset_pools():
+    global _pools_lock
+    for pool in _pools.values():
+        _inherited.extend(entry.connection for entry in pool._idle)
+        _inherited.extend(entry.connection for entry in pool._in_use.values())
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pools)
@@ -0,0 +1,31 @@
+from typing import Dict
+
+from django.db.models import QuerySet
+
+
+def delete_in_chunks(queryset: QuerySet, chunk_size: int) -> Dict[str, int]:
+    """
+    Delete every row matched by ``queryset`` in primary-key-ordered chunks
+    of at most ``chunk_size`` rows, each in its own short transaction.
+
+    Notes:
+    - Each chunk is deleted through ``queryset`` itself, so a row that
+    stopped matching after its pk was read (say, a user who activated in
+    between) is left alone.
+    - Stops early when a chunk deletes nothing, rather than selecting the
+    same undeletable rows forever.
+
+    Returns the number of rows removed per model, cascades included.
+    """
+    removed: Dict[str, int] = {}
+    while True:
+        pks = list(
+            queryset.order_by("pk").values_list("pk", flat=True)[:chunk_size]
+        )
+        if not pks:
+            return removed
+        deleted, per_model = queryset.filter(pk__in=pks).delete()
+        if not deleted:
+            return removed
+        for label, count in per_model.items():
+            removed[label] = removed.get(label, 0) + count
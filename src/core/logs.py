@@ -0,0 +1,170 @@
+"""
+Logging pieces wired up by LOGGING in core.settings.
+
+Request threads only filter a record, render its message and drop it on
+a queue; formatting and writing happen on a background listener thread,
+so a slow stdout never holds up a request.
+"""
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the keys Cloud Logging reads
+    (``severity``, ``message``) plus the logger name and any exception.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keep every record above DEBUG but only a ``rate`` share of DEBUG."""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Queue-backed handler whose listener thread writes to stderr.
+
+    Notes:
+    - The queue is bounded; when it is full records are dropped and
+    counted in ``dropped`` rather than blocking the caller. A warning
+    with the count goes out once there is room again.
+    - Like QueueHandler, records are queued with their message and any
+    traceback already rendered, and without args or exc_info, so the
+    listener never reads objects the caller has since mutated or keeps
+    exception frames alive. Formatting is left to the listener.
+    - Forked children (gunicorn and Celery workers) get their own queue
+    and listener, since threads don't survive a fork.
+    - Configure it with the ``"()"`` factory key: Python 3.12's
+    dictConfig treats ``"class"`` QueueHandlers specially.
+    """
+
+    def __init__(self, queue_size: int = 10000, stream=None):
+        self.queue_size = queue_size
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = self._unreported = 0
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self._start_listener()
+        _handlers.append(self)
+
+    def _start_listener(self):
+        self.listener = QueueListener(
+            self.queue, self.target, respect_handler_level=True
+        )
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        # Formatting is the listener's job
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A copy, so handlers after this one still see the original
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self._unreported:
+                self.queue.put_nowait(self._drop_notice())
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+    def _drop_notice(self) -> logging.LogRecord:
+        return logging.LogRecord(
+            __name__,
+            logging.WARNING,
+            __file__,
+            0,
+            "Log queue full, dropped %d records",
+            (self._unreported,),
+            None,
+        )
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        self.target.close()
+        super().close()
+
+    def _restart_after_fork(self):
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.dropped = self._unreported = 0
+        self._start_listener()
+
+
+_handlers = []
+_formatter = logging.Formatter()
+
+
+def _restart_listeners():
+    for handler in _handlers:
+        if handler.listener is not None:
+            handler._restart_after_fork()
+
+
+def _stop_listeners():
+    # Flush what is still queued on interpreter exit
+    for handler in _handlers:
+        if handler.listener is not None:
+            try:
+                handler.listener.stop()
+            except queue.Full:
+                pass
+            handler.listener = None
+
+
+os.register_at_fork(after_in_child=_restart_listeners)
+atexit.register(_stop_listeners)
+
+
+def parse_levels(spec: str) -> dict:
+    """Parse ``"django.db=WARNING,notification=DEBUG"`` into levels."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
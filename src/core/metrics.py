@@ -0,0 +1,228 @@
+"""
+Prometheus instrumentation for requests, SQL, connection pools, caches
+and Celery tasks.
+
+Everything here is a no-op when prometheus_client isn't installed or
+METRICS_ENABLED is off. With PROMETHEUS_MULTIPROC_DIR set, every process
+(gunicorn workers, Celery pool children) writes its samples to that
+directory and a scrape aggregates them all.
+"""
+
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from celery import signals
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram, multiprocess
+except ImportError:  # pragma: no cover - prometheus_client is optional
+    prometheus_client = None
+
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+if prometheus_client is not None:
+    REQUESTS = Counter(
+        "http_requests_total",
+        "HTTP requests by route and status code",
+        ["method", "route", "status"],
+    )
+    REQUEST_LATENCY = Histogram(
+        "http_request_duration_seconds",
+        "Time spent handling a request, middleware included",
+        ["method", "route"],
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    )
+    REQUEST_QUERIES = Histogram(
+        "http_request_db_queries",
+        "SQL queries run per request",
+        ["route"],
+        buckets=(0, 1, 2, 4, 8, 16, 32, 64),
+    )
+    REQUEST_OVER_QUERY_BUDGET = Counter(
+        "http_requests_over_query_budget_total",
+        "Requests that ran more SQL queries than their view's budget",
+        ["route"],
+    )
+    REQUEST_DB_SECONDS = Counter(
+        "http_request_db_seconds_total",
+        "Time spent in SQL queries by route",
+        ["route"],
+    )
+    # Summed over the live processes, each with pools of its own
+    DB_POOL_CONNECTIONS = Gauge(
+        "db_pool_connections",
+        "Pooled database connections by state (in_use, idle)",
+        ["alias", "state"],
+        multiprocess_mode="livesum",
+    )
+    DB_POOL_WAITS = Counter(
+        "db_pool_waits_total",
+        "Checkouts that had to wait for a pooled connection",
+        ["alias"],
+    )
+    DB_POOL_TIMEOUTS = Counter(
+        "db_pool_timeouts_total",
+        "Checkouts that gave up waiting for a pooled connection",
+        ["alias"],
+    )
+    DB_POOL_WAIT_SECONDS = Counter(
+        "db_pool_wait_seconds_total",
+        "Time spent waiting for a pooled connection",
+        ["alias"],
+    )
+    CACHE_LOOKUPS = Counter(
+        "cache_lookups_total",
+        "Cache lookups by namespace and outcome",
+        ["namespace", "result"],
+    )
+    TASK_RUNTIME = Histogram(
+        "celery_task_runtime_seconds",
+        "Time spent running a task",
+        ["task", "state"],
+        buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+    )
+    TASK_QUEUE_WAIT = Histogram(
+        "celery_task_queue_wait_seconds",
+        "Time between publishing a task and a worker starting it",
+        ["task", "queue"],
+        buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+    )
+
+
+def is_enabled() -> bool:
+    return prometheus_client is not None and settings.METRICS_ENABLED
+
+
+def get_registry():
+    """Return the registry to scrape, merged across processes if needed."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return prometheus_client.REGISTRY
+    registry = prometheus_client.CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def mark_process_dead(pid: int):
+    """Drop the live-only samples of an exited worker process."""
+    if prometheus_client and "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def record_pool_connections(alias: str, in_use: int, idle: int):
+    if is_enabled():
+        DB_POOL_CONNECTIONS.labels(alias, "in_use").set(in_use)
+        DB_POOL_CONNECTIONS.labels(alias, "idle").set(idle)
+
+
+def record_pool_wait(alias: str, seconds: float, timed_out: bool):
+    if is_enabled():
+        DB_POOL_WAITS.labels(alias).inc()
+        DB_POOL_WAIT_SECONDS.labels(alias).inc(seconds)
+        if timed_out:
+            DB_POOL_TIMEOUTS.labels(alias).inc()
+
+
+def record_cache_lookup(namespace: str, hit: bool):
+    if is_enabled():
+        CACHE_LOOKUPS.labels(namespace, "hit" if hit else "miss").inc()
+
+
+def route_label(request) -> str:
+    # The view name keeps label cardinality bounded, unlike the raw path
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status code and SQL usage of every request.
+
+    Notes:
+    - Must come before QueryBudgetMiddleware, whose per-request query
+    count and time it reports.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def observe(request, response, elapsed: float):
+        method = request.method if request.method in HTTP_METHODS else "other"
+        route = route_label(request)
+        REQUESTS.labels(method, route, response.status_code).inc()
+        REQUEST_LATENCY.labels(method, route).observe(elapsed)
+
+        count = getattr(request, "query_count", None)
+        if count is not None:
+            REQUEST_QUERIES.labels(route).observe(count)
+            REQUEST_DB_SECONDS.labels(route).inc(request.query_duration)
+            budget = getattr(request, "query_budget", None)
+            if budget is not None and count > budget:
+                REQUEST_OVER_QUERY_BUDGET.labels(route).inc()
+
+
+# Task start times by task id, within the process running the task
+_task_started = {}
+
+
+@signals.before_task_publish.connect(dispatch_uid="metrics_task_published")
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers["published_at"] = time.time()
+
+
+@signals.task_prerun.connect(dispatch_uid="metrics_task_prerun")
+def task_started(task_id=None, task=None, **kwargs):
+    if not is_enabled():
+        return
+    _task_started[task_id] = time.perf_counter()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at is not None:
+        queue = (task.request.delivery_info or {}).get("routing_key", "")
+        TASK_QUEUE_WAIT.labels(task.name, queue).observe(
+            max(time.time() - published_at, 0)
+        )
+
+
+@signals.task_postrun.connect(dispatch_uid="metrics_task_postrun")
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_RUNTIME.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - started
+        )
+
+
+@signals.worker_ready.connect(dispatch_uid="metrics_worker_http_server")
+def start_worker_metrics_server(**kwargs):
+    # Workers serve no HTTP, so they expose their own scrape endpoint
+    if is_enabled() and settings.METRICS_CELERY_PORT:
+        prometheus_client.start_http_server(
+            settings.METRICS_CELERY_PORT, registry=get_registry()
+        )
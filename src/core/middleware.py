@@ -0,0 +1,119 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from core.query_budget import get_query_budget
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# The counter of the request being handled. Context variables follow the
+# request into sync_to_async threads, so queries issued by async views are
+# counted too.
+current_query_counter: ContextVar[Optional[QueryCounter]] = ContextVar(
+    "current_query_counter", default=None
+)
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = current_query_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.duration += time.perf_counter() - start
+        counter.count += 1
+
+
+def install_query_counter(connection):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+@receiver(connection_created, dispatch_uid="install_query_counter")
+def on_connection_created(sender, connection, **kwargs):
+    install_query_counter(connection)
+
+
+class QueryBudgetMiddleware:
+    """
+    Counts the SQL queries and database time of every request and checks
+    them against the view's declared query budget.
+
+    Notes:
+    - An exceeded budget is logged as a warning (and counted by
+    MetricsMiddleware), never raised: by then the view has already
+    committed its writes. The tests in iam.tests assert the budgets.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(connection)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func, request)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = QueryCounter()
+        token = current_query_counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_query_counter.reset(token)
+        self.check_budget(request, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        token = current_query_counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_query_counter.reset(token)
+        self.check_budget(request, counter)
+        return response
+
+    def check_budget(self, request, counter: QueryCounter):
+        request.query_count = counter.count
+        request.query_duration = counter.duration
+        logger.debug(
+            "%s %s ran %d queries in %.1fms",
+            request.method,
+            request.path,
+            counter.count,
+            counter.duration * 1000,
+        )
+
+        budget = getattr(request, "query_budget", None)
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                "%s %s ran %d queries, over its budget of %d",
+                request.method,
+                request.path,
+                counter.count,
+                budget,
+            )
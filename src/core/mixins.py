@@ -26,3 +26,61 @@ class UUIDMixin(models.Model):
 
     class Meta:
         abstract = True
+
+
+class DirtyFieldsMixin(models.Model):
+    """
+    Tracks changes to ``tracked_fields`` between loading (or the last
+    save) and the next save.
+
+    Notes:
+    - ``saved_changes`` holds the tracked fields the last save actually
+    wrote, mapped to their previous values, so post_save receivers can
+    react to real changes only. On a new instance every tracked field
+    counts as changed.
+    - A field left out of ``update_fields`` isn't written, so it doesn't
+    count as changed.
+    """
+
+    tracked_fields: tuple = ()
+
+    class Meta:
+        abstract = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaded_values = {}
+        self.saved_changes = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_tracked_values()
+        return instance
+
+    def _remember_tracked_values(self):
+        # Deferred fields aren't in __dict__ and can't have been changed
+        self._loaded_values = {
+            name: self.__dict__[name]
+            for name in self.tracked_fields
+            if name in self.__dict__
+        }
+
+    def get_dirty_fields(self) -> dict:
+        """Return the changed tracked fields mapped to their old values."""
+        if self._state.adding:
+            return dict.fromkeys(self.tracked_fields)
+        return {
+            name: old
+            for name, old in self._loaded_values.items()
+            if self.__dict__.get(name, old) != old
+        }
+
+    def save(self, *args, **kwargs):
+        dirty = self.get_dirty_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            dirty = {k: v for k, v in dirty.items() if k in update_fields}
+        self.saved_changes = dirty
+        super().save(*args, **kwargs)
+        self._remember_tracked_values()
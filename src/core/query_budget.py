@@ -0,0 +1,47 @@
+from typing import Callable, Optional
+
+from django.http import HttpRequest
+
+
+def query_budget(max_queries: int):
+    """
+    Declare the maximum number of SQL queries a view (or viewset action)
+    may run per request, including authentication.
+    """
+
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorator
+
+
+def get_query_budget(
+    view_func: Callable, request: HttpRequest
+) -> Optional[int]:
+    """
+    Resolve the budget for the view handling ``request``.
+
+    Looks, in order, at a budget set on the view function itself, on the
+    DRF handler method (via ``query_budget``), and in the view class's
+    ``query_budgets`` mapping keyed by action or HTTP method name.
+    """
+    budget = getattr(view_func, "query_budget", None)
+    if budget is not None:
+        return budget
+
+    view_class = getattr(view_func, "cls", None)
+    if view_class is None:
+        return None
+
+    method = request.method.lower()
+    actions = getattr(view_func, "actions", None)
+    handler_name = actions.get(method) if actions else method
+    if handler_name is None:
+        return None
+
+    handler = getattr(view_class, handler_name, None)
+    budget = getattr(handler, "query_budget", None)
+    if budget is not None:
+        return budget
+    return getattr(view_class, "query_budgets", {}).get(handler_name)
@@ -0,0 +1,38 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Datetimes go through DRF's encoder so they keep its millisecond, "Z"
+# suffixed format instead of orjson's RFC 3339 output
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    if orjson is not None
+    else 0
+)
+_encoder = JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    Notes:
+    - Produces the same compact UTF-8 JSON as DRF's renderer; types orjson
+    can't encode natively (Decimal, lazy strings, datetimes, ...) fall back
+    to DRF's JSONEncoder.
+    - Requests that ask for indented output, and installs without orjson,
+    use the stock renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(
+            data, default=_encoder.default, option=ORJSON_OPTIONS
+        )
@@ -15,7 +15,11 @@ import os
 from pathlib import Path
 from urllib.parse import urlparse
 
+from celery.schedules import crontab
 from dotenv import load_dotenv
+from kombu import Queue
+
+from core.logs import parse_levels
 
 load_dotenv()
 
@@ -81,8 +85,31 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "iam.authentication.CachedJWTAuthentication",
+    ),
+    # orjson-backed JSON when installed, DRF's encoder otherwise
+    "DEFAULT_RENDERER_CLASSES": (
+        "core.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
     ),
+    # Proxies that append to X-Forwarded-For in front of the app: Cloud
+    # Run's front end, plus one for an external load balancer. The client
+    # IP the throttles key on is the entry they appended, not one the
+    # client can forge.
+    "NUM_PROXIES": int(os.getenv("DJANGO_NUM_PROXIES", 1)),
+    # Sliding-window limits for the public IAM actions (iam.throttling),
+    # keyed "<throttle_scope>_ip" and "<throttle_scope>_username"
+    "DEFAULT_THROTTLE_RATES": {
+        "register_ip": "20/hour",
+        "activation_ip": "20/hour",
+        "activation_username": "3/hour",
+        "verify_ip": "30/hour",
+        "reset_request_ip": "20/hour",
+        "reset_request_username": "3/hour",
+        "reset_ip": "20/hour",
+        "token_ip": "30/min",
+        "token_username": "10/min",
+    },
 }
 
 SIMPLE_JWT = {
@@ -101,8 +128,12 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_EXP_CLAIM": "refresh_exp",
     "SLIDING_TOKEN_LIFETIME": datetime.timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": datetime.timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "iam.serializers.CachedTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "iam.serializers.CachedTokenRefreshSerializer",
 }
 MIDDLEWARE = [
+    "core.metrics.MetricsMiddleware",
+    "core.middleware.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -122,6 +153,17 @@ CORS_ALLOWED_ORIGINS = [
 
 ROOT_URLCONF = "core.urls"
 
+# Prometheus metrics (core.metrics). The Docker images set
+# PROMETHEUS_MULTIPROC_DIR so a scrape aggregates every gunicorn worker and
+# Celery pool process.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+# /metrics requires "Authorization: Bearer <token>", and is not served at
+# all while this is unset
+METRICS_AUTH_TOKEN = os.getenv("METRICS_AUTH_TOKEN")
+# Port a Celery worker serves its own metrics on, unauthenticated, so keep
+# it on an internal network; unset disables it
+METRICS_CELERY_PORT = int(os.getenv("METRICS_CELERY_PORT", 0)) or None
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -144,19 +186,70 @@ WSGI_APPLICATION = "core.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# With DJANGO_DB_POOL each process shares a bounded pool of connections
+# and returns them after every request. Otherwise each thread keeps its
+# own connection open for DJANGO_DB_CONN_MAX_AGE seconds.
+DB_POOL = os.getenv("DJANGO_DB_POOL") == "True"
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": (
+            "core.db.backends.postgresql_pool"
+            if DB_POOL
+            else "django.db.backends.postgresql"
+        ),
         "NAME": os.getenv("DJANGO_DB_NAME"),
         "USER": os.getenv("DJANGO_DB_USER"),
         "PASSWORD": os.getenv("DJANGO_DB_PASSWORD"),
         "HOST": os.getenv("DJANGO_DB_HOST"),
         "PORT": os.getenv("DJANGO_DB_PORT"),
+        "CONN_MAX_AGE": (
+            0 if DB_POOL else int(os.getenv("DJANGO_DB_CONN_MAX_AGE", 60))
+        ),
+        "CONN_HEALTH_CHECKS": True,
+        "POOL": {
+            "MAX_SIZE": int(os.getenv("DJANGO_DB_POOL_MAX_SIZE", 10)),
+            "TIMEOUT": float(os.getenv("DJANGO_DB_POOL_TIMEOUT", 5)),
+            "MAX_LIFETIME": float(
+                os.getenv("DJANGO_DB_POOL_MAX_LIFETIME", 1800)
+            ),
+            "MAX_IDLE": float(os.getenv("DJANGO_DB_POOL_MAX_IDLE", 300)),
+            "CHECK_INTERVAL": float(
+                os.getenv("DJANGO_DB_POOL_CHECK_INTERVAL", 30)
+            ),
+        },
     }
 }
 
+# Shared cache for every worker and instance (redis:// or rediss:// URL;
+# docker-compose.yml runs one). Without one each process falls back to
+# its own in-memory cache, which suits tests but shares nothing between
+# workers.
+CACHE_URL = os.getenv("DJANGO_CACHE_URL")
+
+CACHES = {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+            "KEY_PREFIX": os.getenv("DJANGO_CACHE_KEY_PREFIX", ""),
+            # Bump to drop every key at once, e.g. on an incompatible deploy
+            "VERSION": int(os.getenv("DJANGO_CACHE_VERSION", 1)),
+            "TIMEOUT": 300,
+        }
+        if CACHE_URL
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "default",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    )
+}
+
 AUTH_USER_MODEL = "iam.User"
 
+AUTHENTICATION_BACKENDS = ["iam.backends.PooledModelBackend"]
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -207,26 +300,84 @@ DJANGO_SUPERUSER_PASSWORD = os.getenv("DJANGO_SUPERUSER_PASSWORD")
 
 SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
 SENDGRID_SENDER_EMAIL = os.getenv("SENDGRID_SENDER_EMAIL")
+SENDGRID_POOL_SIZE = int(os.getenv("SENDGRID_POOL_SIZE", 10))
+SENDGRID_TIMEOUT = int(os.getenv("SENDGRID_TIMEOUT", 10))
+# SendGrid accepts at most 1000 personalizations per mail/send request
+SENDGRID_BATCH_SIZE = 1000
+# Inline <style> rules into email templates when premailer is installed
+EMAIL_INLINE_CSS = os.getenv("EMAIL_INLINE_CSS", "True") == "True"
 FRONTEND_APP_URL = os.getenv("FRONTEND_APP_URL")
 
 USERTOKEN_EXPIRY_HOURS = 24
+# Repeated activation requests within this many seconds reuse the last
+# email instead of rotating the token and sending another one
+IAM_ACTIVATION_EMAIL_COOLDOWN = int(
+    os.getenv("IAM_ACTIVATION_EMAIL_COOLDOWN", 120)
+)
+
+# Authenticated user lookups: shared cache TTL, then a short process-local
+# LRU in front of it (seconds). Both are skipped, like the permission
+# cache, without DJANGO_CACHE_URL.
+IAM_USER_CACHE_TTL = 300
+IAM_USER_CACHE_LOCAL_TTL = 5
+IAM_USER_CACHE_LOCAL_SIZE = 1024
+# Resolved permission sets, shared between workers (seconds)
+IAM_PERMISSION_CACHE_TTL = 300
+
+# Spawned processes hashing and checking passwords, per web worker. Login,
+# register and reset wait on them; with threaded (gthread) gunicorn workers
+# the waits overlap while the hashing runs on the free cores. Daemonic
+# processes (Celery prefork children) hash inline.
+IAM_HASHING_WORKERS = int(
+    os.getenv("IAM_HASHING_WORKERS", os.cpu_count() or 1)
+)
+# Hash/verify jobs allowed in flight per process, and how long a request
+# waits for a free slot before getting a 503
+IAM_HASHING_MAX_PENDING = IAM_HASHING_WORKERS * 4
+IAM_HASHING_QUEUE_TIMEOUT = 2
+# Bulk registration: rows per request and per INSERT. The passwords are
+# hashed within the request, at roughly a quarter second of CPU each per
+# hashing worker, so keep a full request well inside the gunicorn timeout.
+IAM_BULK_REGISTER_MAX_ROWS = 200
+IAM_BULK_REGISTER_BATCH_SIZE = 500
+
+# Periodic cleanup of token and verification tables
+IAM_PRUNE_CHUNK_SIZE = 1000
+IAM_UNVERIFIED_RETENTION_DAYS = 30
+
+# Records are written by a background thread (core.logs) as JSON lines,
+# or plain text with LOG_FORMAT=text. LOG_LEVELS sets per-logger levels,
+# e.g. "django.db.backends=WARNING,notification=DEBUG", and only a
+# LOG_DEBUG_SAMPLE_RATE share of DEBUG records is kept.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG" if DEBUG else "INFO")
+LOG_LEVELS = parse_levels(os.getenv("LOG_LEVELS", ""))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
 
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
-    "handlers": {
-        "console": {
-            "level": "DEBUG" if DEBUG else "INFO",
-            "class": "logging.StreamHandler",
+    "formatters": {
+        "json": {"()": "core.logs.JSONFormatter"},
+        "text": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "filters": {
+        "sample_debug": {
+            "()": "core.logs.DebugSamplingFilter",
+            "rate": LOG_DEBUG_SAMPLE_RATE,
         },
     },
-    "loggers": {
-        "": {
-            "handlers": ["console"],
-            "level": "DEBUG",
-            "propagate": True,
+    "handlers": {
+        "console": {
+            "()": "core.logs.BackgroundHandler",
+            "queue_size": LOG_QUEUE_SIZE,
+            "formatter": LOG_FORMAT,
+            "filters": ["sample_debug"],
         },
     },
+    "root": {"handlers": ["console"], "level": LOG_LEVEL},
+    "loggers": {name: {"level": level} for name, level in LOG_LEVELS.items()},
 }
 
 CELERY_BROKER_URL = os.getenv(
@@ -237,3 +388,57 @@ CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
+
+# Queues: "email" carries single, latency-sensitive sends, "bulk_email"
+# the batched ones, and "maintenance" the long periodic jobs. The email
+# queues are served by the thread-pool worker in docker-compose.yml.
+# Everything else stays on Celery's own "celery" queue, so messages queued
+# before these routes existed are still consumed.
+CELERY_TASK_DEFAULT_QUEUE = "celery"
+CELERY_TASK_QUEUES = [
+    Queue(name, routing_key=name)
+    for name in ("celery", "email", "bulk_email", "maintenance")
+]
+CELERY_TASK_ROUTES = {
+    "send_activation_email": {"queue": "email"},
+    "send_reset_email": {"queue": "email"},
+    "send_activation_emails": {"queue": "bulk_email"},
+    "prune_*": {"queue": "maintenance"},
+    "purge_task_results": {"queue": "maintenance"},
+}
+# Reserve one message per process at a time, so a long task never sits
+# on prefetched messages another worker could be running
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Tasks that keep a result (the notification tasks ignore theirs) only
+# need it for a day; purge_task_results removes older rows in chunks
+CELERY_RESULT_EXPIRES = datetime.timedelta(
+    hours=int(os.getenv("CELERY_RESULT_EXPIRES_HOURS", 24))
+)
+CELERY_RESULT_PURGE_CHUNK_SIZE = 1000
+# Run tasks inline (e.g. in tests) instead of publishing them to the broker
+CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER") == "True"
+CELERY_TASK_EAGER_PROPAGATES = CELERY_TASK_ALWAYS_EAGER
+# ...and still store their results, so bulk registration jobs can be polled
+CELERY_TASK_STORE_EAGER_RESULT = True
+
+# Workers log through LOGGING like the web processes, instead of Celery
+# replacing the root logger's handlers
+CELERY_WORKER_HIJACK_ROOT_LOGGER = False
+
+CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+CELERY_BEAT_SCHEDULE = {
+    "prune-expired-tokens": {
+        "task": "prune_expired_tokens",
+        "schedule": crontab(minute=15, hour=3),
+    },
+    "prune-unverified-users": {
+        "task": "prune_unverified_users",
+        "schedule": crontab(minute=45, hour=3),
+    },
+    # Replaces celery's built-in entry of the same name, whose cleanup is
+    # one unbounded DELETE on the results table
+    "celery.backend_cleanup": {
+        "task": "purge_task_results",
+        "schedule": crontab(minute=15, hour=4),
+    },
+}
@@ -0,0 +1,275 @@
+import datetime
+import json
+import logging
+import sys
+import threading
+import uuid
+from io import StringIO
+from unittest import skipUnless
+
+import psycopg2
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.testcases import TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from django_celery_beat.models import PeriodicTask
+from django_celery_beat.schedulers import DatabaseScheduler
+from django_celery_results.models import TaskResult
+from psycopg2 import extensions
+
+from core import metrics
+from core.celery import app as celery_app
+from core.celery import purge_task_results
+from core.db import pool as pool_module
+from core.db.pool import ConnectionPool, PoolTimeout
+from core.logs import BackgroundHandler, JSONFormatter
+
+
+@skipUnless(connection.vendor == "postgresql", "needs PostgreSQL")
+class ConnectionPoolTests(SimpleTestCase):
+    """ConnectionPool against the test database's server."""
+
+    databases = {"default"}
+
+    def setUp(self):
+        params = connection.get_connection_params()
+        self.connect = lambda: psycopg2.connect(**params)
+
+    def make_pool(self, **options) -> ConnectionPool:
+        pool = ConnectionPool(**options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_returned_connection_is_reused(self):
+        pool = self.make_pool(max_size=2)
+        first = pool.getconn(self.connect)
+        pool.putconn(first)
+        second = pool.getconn(self.connect)
+        pool.putconn(second)
+
+        self.assertIs(first, second)
+        stats = pool.stats()
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["creations"], 1)
+        self.assertEqual(stats["idle"], 1)
+        self.assertEqual(stats["in_use"], 0)
+
+    def test_open_transaction_is_rolled_back_on_return(self):
+        pool = self.make_pool(max_size=1)
+        conn = pool.getconn(self.connect)
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE TEMPORARY TABLE pool_test (id int)")
+        self.assertEqual(
+            conn.get_transaction_status(),
+            extensions.TRANSACTION_STATUS_INTRANS,
+        )
+        pool.putconn(conn)
+
+        conn = pool.getconn(self.connect)
+        self.assertEqual(
+            conn.get_transaction_status(), extensions.TRANSACTION_STATUS_IDLE
+        )
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pool_test')")
+            self.assertIsNone(cursor.fetchone()[0])
+        pool.putconn(conn)
+
+    def test_full_pool_times_out(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        conn = pool.getconn(self.connect)
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(self.connect)
+        pool.putconn(conn)
+
+        stats = pool.stats()
+        self.assertEqual(stats["waits"], 1)
+        self.assertEqual(stats["timeouts"], 1)
+
+    def test_waiter_gets_the_returned_connection(self):
+        pool = self.make_pool(max_size=1, timeout=5)
+        conn = pool.getconn(self.connect)
+        borrowed = []
+        waiter = threading.Thread(
+            target=lambda: borrowed.append(pool.getconn(self.connect))
+        )
+        waiter.start()
+        pool.putconn(conn)
+        waiter.join(5)
+
+        self.assertEqual(borrowed, [conn])
+        pool.putconn(conn)
+        self.assertEqual(pool.stats()["creations"], 1)
+
+    def test_discarded_connection_frees_its_slot(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        conn = pool.getconn(self.connect)
+        pool.putconn(conn, discard=True)
+
+        self.assertTrue(conn.closed)
+        replacement = pool.getconn(self.connect)
+        self.assertIsNot(replacement, conn)
+        pool.putconn(replacement)
+        self.assertEqual(pool.stats()["discards"], 1)
+
+    def test_backend_hands_connections_back_to_the_pool(self):
+        alias = "pool_test"
+        backend = load_backend("core.db.backends.postgresql_pool")
+        wrapper = backend.DatabaseWrapper(
+            {**connection.settings_dict, "POOL": {"MAX_SIZE": 1}}, alias
+        )
+        self.addCleanup(pool_module._pools.pop, alias, None)
+        self.addCleanup(wrapper.pool.close)
+
+        for _ in range(3):
+            with wrapper.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            wrapper.close()
+
+        stats = wrapper.pool.stats()
+        self.assertEqual(stats["creations"], 1)
+        self.assertEqual(stats["checkouts"], 3)
+        self.assertEqual(stats["idle"], 1)
+
+    @skipUnless(metrics.is_enabled(), "needs prometheus_client")
+    def test_usage_is_exported_to_prometheus(self):
+        alias = f"pool_test_{threading.get_ident()}"
+
+        def sample(name, **labels):
+            return metrics.prometheus_client.REGISTRY.get_sample_value(
+                name, {"alias": alias, **labels}
+            )
+
+        pool = self.make_pool(alias=alias, max_size=1, timeout=0.05)
+        conn = pool.getconn(self.connect)
+        self.assertEqual(sample("db_pool_connections", state="in_use"), 1)
+        self.assertEqual(sample("db_pool_connections", state="idle"), 0)
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(self.connect)
+        pool.putconn(conn)
+
+        self.assertEqual(sample("db_pool_connections", state="in_use"), 0)
+        self.assertEqual(sample("db_pool_connections", state="idle"), 1)
+        self.assertEqual(sample("db_pool_waits_total"), 1)
+        self.assertEqual(sample("db_pool_timeouts_total"), 1)
+        self.assertGreater(sample("db_pool_wait_seconds_total"), 0)
+
+
+class MetricsViewTests(SimpleTestCase):
+    def scrape(self, **headers):
+        return self.client.get(reverse("metrics"), headers=headers)
+
+    @override_settings(METRICS_AUTH_TOKEN=None)
+    def test_not_served_without_a_token(self):
+        self.assertEqual(self.scrape().status_code, 404)
+
+    @override_settings(METRICS_AUTH_TOKEN="secret")
+    def test_requires_the_token(self):
+        self.assertEqual(self.scrape().status_code, 401)
+        response = self.scrape(Authorization="Bearer wrong")
+        self.assertEqual(response.status_code, 401)
+
+        response = self.scrape(Authorization="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"http_requests_total", response.content)
+
+
+class PurgeTaskResultsTests(TestCase):
+    def create_results(self, count, age):
+        ids = [str(uuid.uuid4()) for _ in range(count)]
+        TaskResult.objects.bulk_create(
+            TaskResult(task_id=task_id, status="SUCCESS") for task_id in ids
+        )
+        # date_done is auto_now, so it is backdated in a separate update
+        TaskResult.objects.filter(task_id__in=ids).update(
+            date_done=timezone.now() - age
+        )
+        return ids
+
+    @override_settings(CELERY_RESULT_EXPIRES=datetime.timedelta(hours=1))
+    def test_deletes_expired_results_and_keeps_fresh_ones(self):
+        self.create_results(5, datetime.timedelta(hours=2))
+        fresh = self.create_results(2, datetime.timedelta(minutes=30))
+
+        removed = purge_task_results(chunk_size=2)
+
+        self.assertEqual(removed, {"django_celery_results.TaskResult": 5})
+        self.assertCountEqual(
+            TaskResult.objects.values_list("task_id", flat=True), fresh
+        )
+
+
+class BeatScheduleTests(TransactionTestCase):
+    # DatabaseScheduler closes the connection, which a TestCase's
+    # transaction doesn't survive
+
+    def test_replaces_celerys_backend_cleanup(self):
+        # DatabaseScheduler installs celery's own entry, then the schedule
+        # from settings over it
+        DatabaseScheduler(app=celery_app)
+
+        entry = PeriodicTask.objects.get(name="celery.backend_cleanup")
+        self.assertEqual(entry.task, "purge_task_results")
+        self.assertEqual(
+            (entry.crontab.minute, entry.crontab.hour), ("15", "4")
+        )
+
+
+class BackgroundHandlerTests(SimpleTestCase):
+    def setUp(self):
+        self.stream = StringIO()
+        self.handler = BackgroundHandler(stream=self.stream)
+        self.handler.setFormatter(JSONFormatter())
+        self.addCleanup(self.handler.close)
+        self.logger = logging.getLogger(f"core.tests.{self.id()}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def entries(self):
+        # Stopping the listener drains the queue
+        self.handler.close()
+        return [
+            json.loads(line) for line in self.stream.getvalue().splitlines()
+        ]
+
+    def test_arguments_are_read_at_the_call(self):
+        items = ["before"]
+        self.logger.warning("items: %s", items)
+        items[0] = "after"
+
+        (entry,) = self.entries()
+        self.assertEqual(entry["message"], "items: ['before']")
+
+    def test_traceback_is_rendered_before_queueing(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = self.logger.makeRecord(
+                self.logger.name,
+                logging.ERROR,
+                __file__,
+                0,
+                "failed %s",
+                ("here",),
+                sys.exc_info(),
+            )
+
+        queued = self.handler.prepare(record)
+
+        self.assertEqual(queued.msg, "failed here")
+        self.assertIsNone(queued.args)
+        self.assertIsNone(queued.exc_info)
+        self.assertIn("ValueError: boom", queued.exc_text)
+        # The caller's record is left alone for the other handlers
+        self.assertIsNotNone(record.exc_info)
+
+        self.handler.handle(record)
+        (entry,) = self.entries()
+        self.assertEqual(entry["message"], "failed here")
+        self.assertIn("ValueError: boom", entry["exception"])
+
+    def test_celery_leaves_the_root_logger_alone(self):
+        self.assertFalse(celery_app.conf.worker_hijack_root_logger)
@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Union
 
-from django.urls import URLResolver
+from django.urls import URLPattern, URLResolver
 
 """
 URL configuration for TEAM Utils project.
@@ -22,8 +22,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
-urlpatterns: List[URLResolver] = [
+from core.views import metrics_view
+
+urlpatterns: List[Union[URLPattern, URLResolver]] = [
     path("admin/", admin.site.urls),
     path("api/", include("iam.urls")),
+    path("metrics", metrics_view, name="metrics"),
     path("health/", include("health_check.urls")),
 ]
@@ -0,0 +1,28 @@
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from rest_framework import status
+
+from core import metrics
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint.
+
+    Requires "Authorization: Bearer <METRICS_AUTH_TOKEN>"; without a token
+    configured the endpoint doesn't exist.
+    """
+    token = settings.METRICS_AUTH_TOKEN
+    if not metrics.is_enabled() or not token:
+        raise Http404
+    expected = f"Bearer {token}"
+    given = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(given.encode(), expected.encode()):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+
+    body = metrics.prometheus_client.generate_latest(metrics.get_registry())
+    return HttpResponse(
+        body, content_type=metrics.prometheus_client.CONTENT_TYPE_LATEST
+    )
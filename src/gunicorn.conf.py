@@ -0,0 +1,8 @@
+"""Gunicorn settings picked up from the working directory (src/)."""
+
+
+def child_exit(server, worker):
+    # Let the multiprocess metrics forget the worker's live samples
+    from core.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
@@ -7,4 +7,9 @@ class IAMConfig(AppConfig):
     verbose_name = "Identity and Access Management"
 
     def ready(self):
+        from health_check.plugins import plugin_dir
+
         import iam.signals  # noqa: F401
+        from iam.health import IAMCacheHealthCheck
+
+        plugin_dir.register(IAMCacheHealthCheck)
@@ -0,0 +1,52 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from iam.cache import get_cached_permissions
+from iam.hashing import hash_password, verify_password
+
+UserModel = get_user_model()
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend that checks passwords on the hashing pool.
+
+    Notes:
+    - A valid password stored with an outdated hasher or work factor is
+    rehashed with the default hasher and saved on the spot.
+    - Permission sets are resolved through the shared cache.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway so response time doesn't reveal unknown usernames
+            hash_password(password)
+            return None
+
+        valid, new_encoded = verify_password(password, user.password)
+        if not valid:
+            return None
+        if new_encoded:
+            user.password = new_encoded
+            user.save(update_fields=["password"])
+        if self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, "_perm_cache"):
+            user_obj._perm_cache = get_cached_permissions(
+                user_obj.pk, partial(super().get_all_permissions, user_obj)
+            )
+        return user_obj._perm_cache
@@ -0,0 +1,161 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from django.conf import settings
+
+from core.cache import CacheNamespace
+from core.metrics import record_cache_lookup
+from iam.models import User
+
+
+class LocalTTLCache:
+    """
+    A small thread-safe, process-local LRU cache whose entries expire
+    after ``ttl`` seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_user_cache = LocalTTLCache(
+    maxsize=settings.IAM_USER_CACHE_LOCAL_SIZE,
+    ttl=settings.IAM_USER_CACHE_LOCAL_TTL,
+)
+
+
+# Bump a version when the shape of what is cached under it changes
+users = CacheNamespace("iam:user", version=3)
+permissions = CacheNamespace("iam:perms", generational=True)
+blacklist = CacheNamespace("iam:blacklist")
+activation_cooldowns = CacheNamespace("iam:activation-cooldown")
+
+
+def load_user(user_id) -> Optional[User]:
+    # The password hash is left out and only read if something asks for it
+    return User.objects.defer("password").filter(uuid=user_id).first()
+
+
+def get_cached_user(user_id) -> Optional[User]:
+    """
+    Resolve a user by primary key through the process-local LRU, then the
+    shared Django cache, and only then the database.
+
+    Returns a copy so callers can't mutate the cached instance.
+
+    Notes:
+    - Without a shared cache backend an invalidation would only reach the
+    process that made the change, so every lookup goes to the database.
+    - The password hash is never cached; reading it costs a query.
+    """
+    if not users.shared:
+        return load_user(user_id)
+
+    key = users.key(user_id)
+    user = local_user_cache.get(key)
+    record_cache_lookup("iam:user:local", user is not None)
+    if user is None:
+        user = users.get_or_compute(
+            user_id, lambda: load_user(user_id), settings.IAM_USER_CACHE_TTL
+        )
+        if user is None:
+            return None
+        local_user_cache.set(key, user)
+    return copy.copy(user)
+
+
+def invalidate_cached_user(user_id):
+    local_user_cache.delete(users.key(user_id))
+    users.delete(user_id)
+    permissions.delete(user_id)
+
+
+def get_cached_permissions(user_id, compute: Callable) -> set:
+    # Process-local entries would outlive a grant or revoke elsewhere
+    if not permissions.shared:
+        return compute()
+    return permissions.get_or_compute(
+        user_id, compute, settings.IAM_PERMISSION_CACHE_TTL
+    )
+
+
+def invalidate_cached_permissions():
+    # Group and permission changes can touch any number of users
+    permissions.invalidate_all()
+
+
+def get_blacklist_state(jti: str) -> Optional[bool]:
+    """
+    Return whether the token is blacklisted, or None when the cache has no
+    answer and the database must be consulted.
+    """
+    return blacklist.get(jti)
+
+
+def set_blacklist_state(jti: str, blacklisted: bool, exp: int):
+    """
+    Remember whether a token is blacklisted until it expires on its own.
+
+    Notes:
+    - "Not blacklisted" is only added when nothing is cached for the token,
+    so it can never undo a concurrent blacklisting.
+    - It is also only cached on a shared backend: a process-local entry
+    would outlive a logout or rotation handled by another process.
+    """
+    timeout = exp - int(time.time())
+    if timeout <= 0:
+        return
+    if blacklisted:
+        blacklist.set(jti, True, timeout)
+    elif blacklist.shared:
+        blacklist.cache.add(blacklist.key(jti), False, timeout)
+
+
+def activation_email_cooling_down(user_id) -> bool:
+    """Whether an activation email went out to the user moments ago."""
+    return activation_cooldowns.get(user_id) is not None
+
+
+def claim_activation_email(user_id) -> bool:
+    """
+    Start the activation email cool-down for a user, returning False when
+    one is already running.
+    """
+    return activation_cooldowns.cache.add(
+        activation_cooldowns.key(user_id),
+        True,
+        settings.IAM_ACTIVATION_EMAIL_COOLDOWN,
+    )
@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+T = TypeVar("T")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_slots: Optional[threading.BoundedSemaphore] = None
+
+
+class HashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many concurrent requests, try again shortly."
+    default_code = "hashing_unavailable"
+
+
+def get_hashing_pool() -> ProcessPoolExecutor:
+    """Return the process pool used for password hashing."""
+    global _pool, _slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _slots = threading.BoundedSemaphore(
+                    settings.IAM_HASHING_MAX_PENDING
+                )
+                # Spawned, not forked: forking while the core.logs
+                # listener thread holds its queue's lock would leave the
+                # child deadlocked on its first log call
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.IAM_HASHING_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=django.setup,
+                )
+    return _pool
+
+
+def pool_available() -> bool:
+    """
+    Whether this process may use the hashing pool.
+
+    Daemonic processes, such as Celery's prefork children, may not start
+    one and hash inline instead.
+    """
+    return not multiprocessing.current_process().daemon
+
+
+@contextmanager
+def hashing_slot():
+    """
+    Reserve one of IAM_HASHING_MAX_PENDING slots for pool work.
+
+    When every slot stays taken for IAM_HASHING_QUEUE_TIMEOUT seconds the
+    request is turned away with a 503 instead of queueing without bound.
+    """
+    pool = get_hashing_pool()
+    if not _slots.acquire(timeout=settings.IAM_HASHING_QUEUE_TIMEOUT):
+        raise HashingUnavailable()
+    try:
+        yield pool
+    finally:
+        _slots.release()
+
+
+def _run(fn: Callable[..., T], *args) -> T:
+    # One call on the pool, or inline where there can't be one
+    if not pool_available():
+        return fn(*args)
+    with hashing_slot() as pool:
+        return pool.submit(fn, *args).result()
+
+
+def _verify(
+    password: str, encoded: str, preferred: str
+) -> Tuple[bool, Optional[str]]:
+    # Runs in a pool worker. Returns whether the password matches and, if
+    # the stored hash is outdated, its replacement under ``preferred``.
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False, None
+
+    if not hasher.verify(password, encoded):
+        return False, None
+
+    preferred_hasher = hashers.get_hasher(preferred)
+    if hasher.algorithm != preferred or preferred_hasher.must_update(encoded):
+        return True, hashers.make_password(password, hasher=preferred)
+    return True, None
+
+
+# Pool workers don't see settings overridden in the calling process, so the
+# default hasher is resolved here and passed to them by name.
+
+
+def hash_password(password: str) -> str:
+    """Hash ``password`` with the default hasher on the hashing pool."""
+    default = hashers.get_hasher("default").algorithm
+    return _run(partial(hashers.make_password, hasher=default), password)
+
+
+def verify_password(password: str, encoded: str) -> Tuple[bool, Optional[str]]:
+    """
+    Check ``password`` against ``encoded`` on the hashing pool.
+
+    Returns ``(valid, new_encoded)``; ``new_encoded`` is set when the
+    password is valid but was stored with an outdated hasher or work
+    factor.
+    """
+    if not encoded:
+        return False, None
+    default = hashers.get_hasher("default").algorithm
+    return _run(_verify, password, encoded, default)
+
+
+def hash_passwords(passwords: List[str], hasher: str = "default") -> List[str]:
+    """
+    Hash many passwords in parallel across the hashing pool.
+
+    ``hasher`` is the algorithm name, as in ``make_password``.
+    """
+    if not passwords:
+        return []
+    make_password = partial(hashers.make_password, hasher=hasher)
+    if not pool_available():
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (settings.IAM_HASHING_WORKERS * 4))
+    with hashing_slot() as pool:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def set_user_password(user, password: str):
+    """Pool-backed equivalent of ``AbstractBaseUser.set_password``."""
+    user.password = hash_password(password)
+    user._password = password
+
+
+def _reset_pool():
+    # A pool inherited from the parent process is not usable in the child
+    global _pool, _pool_lock, _slots
+    _pool = None
+    _pool_lock = threading.Lock()
+    _slots = None
+
+
+os.register_at_fork(after_in_child=_reset_pool)
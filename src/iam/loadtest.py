@@ -0,0 +1,429 @@
+"""
+Load-test harness for the public auth endpoints, driven in-process
+through the WSGI and ASGI handlers (see the bench_auth_load command).
+"""
+
+import asyncio
+import io
+import json
+import math
+import queue
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import default_token_generator
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from iam.models import User, UserVerification
+from iam.tokens import CachedRefreshToken
+
+# scenario -> (path, expected status)
+SCENARIOS: Dict[str, Tuple[str, int]] = {
+    "token": ("/api/token/", 200),
+    "refresh": ("/api/token/refresh/", 200),
+    "register": ("/api/auth/users/register/", 201),
+    "activation": ("/api/auth/request-account-activation/", 200),
+    "verify": ("/api/auth/account-verify/", 200),
+}
+
+DEFAULT_MIX = "token=40,refresh=30,register=10,activation=10,verify=10"
+
+BENCH_DOMAIN = "bench.invalid"
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """Parse ``"token=40,refresh=30"`` into scenario weights."""
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}")
+        mix[name] = int(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The mix must give at least one scenario a weight")
+    return mix
+
+
+def plan_counts(mix: Dict[str, int], requests: int) -> Dict[str, int]:
+    """Split ``requests`` between the scenarios in proportion to ``mix``."""
+    total = sum(mix.values())
+    counts = {name: requests * weight // total for name, weight in mix.items()}
+    # Hand the rounding remainder to the heaviest scenarios
+    leftover = requests - sum(counts.values())
+    for name in sorted(mix, key=mix.get, reverse=True)[:leftover]:
+        counts[name] += 1
+    return counts
+
+
+@dataclass
+class Operation:
+    scenario: str
+    body: bytes
+
+
+@dataclass
+class Sample:
+    scenario: str
+    status: int
+    latency: float
+    queries: int
+
+
+@dataclass
+class Fixtures:
+    """Rows seeded for one run; everything is keyed by ``prefix``."""
+
+    prefix: str
+    password: str
+    active: List[str] = field(default_factory=list)
+    pending: List[str] = field(default_factory=list)
+    verify_tokens: List[str] = field(default_factory=list)
+    refresh_tokens: List[str] = field(default_factory=list)
+
+
+def _email(prefix: str, kind: str, i: int) -> str:
+    return f"{prefix}-{kind}{i}@{BENCH_DOMAIN}"
+
+
+def _create_users(emails, password_hash, is_active, batch_size):
+    users = [
+        User(
+            username=email,
+            email=email,
+            password=password_hash,
+            is_active=is_active,
+        )
+        for email in emails
+    ]
+    return User.objects.bulk_create(users, batch_size=batch_size)
+
+
+def seed(
+    prefix: str,
+    users: int,
+    counts: Dict[str, int],
+    batch_size: int = 1000,
+) -> Fixtures:
+    """
+    Seed ``users`` active accounts plus the pending accounts and refresh
+    tokens the planned operations consume.
+
+    Notes:
+    - bulk_create skips post_save, so seeding sends no emails.
+    - Every account shares one password hash; hashing N passwords would
+    dominate the setup time.
+    """
+    password = f"Bench-{prefix}-Pass!"
+    password_hash = make_password(password)
+    fixtures = Fixtures(prefix=prefix, password=password)
+    now = timezone.now()
+
+    fixtures.active = [_email(prefix, "a", i) for i in range(users)]
+    active = _create_users(fixtures.active, password_hash, True, batch_size)
+    UserVerification.objects.bulk_create(
+        [
+            UserVerification(user=user, is_verified=True, verified_at=now)
+            for user in active
+        ],
+        batch_size=batch_size,
+    )
+
+    # Each verify consumes its own account; activation requests share a
+    # smaller pool and coalesce on the cool-down like real retries do
+    verify = counts.get("verify", 0)
+    pending_count = verify + min(counts.get("activation", 0), users)
+    emails = [_email(prefix, "p", i) for i in range(pending_count)]
+    pending = _create_users(emails, password_hash, False, batch_size)
+    verifications = [
+        UserVerification(
+            user=user, token=default_token_generator.make_token(user)
+        )
+        for user in pending
+    ]
+    UserVerification.objects.bulk_create(verifications, batch_size=batch_size)
+    fixtures.verify_tokens = [v.token for v in verifications[:verify]]
+    fixtures.pending = emails[verify:]
+
+    # Refresh tokens rotate and blacklist the old one, so each refresh
+    # needs a token of its own
+    fixtures.refresh_tokens = [
+        str(CachedRefreshToken.for_user(active[i % len(active)]))
+        for i in range(counts.get("refresh", 0) if active else 0)
+    ]
+    return fixtures
+
+
+def cleanup(prefix: str) -> int:
+    """Delete every account (and its tokens) created under ``prefix``."""
+    OutstandingToken.objects.filter(user__username__startswith=prefix).delete()
+    deleted, _ = User.objects.filter(username__startswith=prefix).delete()
+    return deleted
+
+
+def build_operations(
+    fixtures: Fixtures, counts: Dict[str, int], rng: random.Random
+) -> List[Operation]:
+    """Materialise the request bodies and shuffle them into one stream."""
+    verify_tokens = iter(fixtures.verify_tokens)
+    refresh_tokens = iter(fixtures.refresh_tokens)
+    payloads: Dict[str, Callable[[int], dict]] = {
+        "token": lambda i: {
+            "username": rng.choice(fixtures.active),
+            "password": fixtures.password,
+        },
+        "refresh": lambda i: {"refresh": next(refresh_tokens)},
+        "register": lambda i: {
+            "email": _email(fixtures.prefix, "r", i),
+            "password": fixtures.password,
+        },
+        "activation": lambda i: {"username": rng.choice(fixtures.pending)},
+        "verify": lambda i: {"token": next(verify_tokens)},
+    }
+    operations = [
+        Operation(scenario, json.dumps(payloads[scenario](i)).encode())
+        for scenario, count in counts.items()
+        for i in range(count)
+    ]
+    rng.shuffle(operations)
+    return operations
+
+
+# Queries issued on behalf of the request being timed. Like the query
+# budget counter it follows the request into sync_to_async threads.
+_current_sample: ContextVar[Optional[Sample]] = ContextVar(
+    "loadtest_sample", default=None
+)
+
+
+def _count_query(execute, sql, params, many, context):
+    sample = _current_sample.get()
+    if sample is not None:
+        sample.queries += 1
+    return execute(sql, params, many, context)
+
+
+def _install(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+@contextmanager
+def sample_queries():
+    """Count queries into the current Sample while the block runs."""
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+    connection_created.connect(_install, dispatch_uid="loadtest_queries")
+    try:
+        yield
+    finally:
+        connection_created.disconnect(dispatch_uid="loadtest_queries")
+
+
+def wsgi_post(application, path: str, body: bytes) -> int:
+    """Send one POST through a WSGI ``application``; return the status."""
+    environ = {
+        "REQUEST_METHOD": "POST",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "127.0.0.1",
+        "HTTP_HOST": "localhost",
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+
+    chunks = application(environ, start_response)
+    try:
+        for _ in chunks:
+            pass
+    finally:
+        # Fires request_finished, which recycles the DB connection
+        chunks.close()
+    return response["status"]
+
+
+async def asgi_post(application, path: str, body: bytes) -> int:
+    """Send one POST through an ASGI ``application``; return the status."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"localhost"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    response = {}
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # The client never disconnects early
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+
+    await application(scope, receive, send)
+    return response["status"]
+
+
+def run_wsgi(
+    application, operations: List[Operation], concurrency: int
+) -> Tuple[float, List[Sample]]:
+    """Replay ``operations`` from ``concurrency`` threads."""
+    pending: "queue.SimpleQueue[Operation]" = queue.SimpleQueue()
+    for operation in operations:
+        pending.put(operation)
+    samples: List[Sample] = []
+
+    def worker():
+        try:
+            while True:
+                try:
+                    operation = pending.get_nowait()
+                except queue.Empty:
+                    return
+                sample = Sample(operation.scenario, 0, 0.0, 0)
+                token = _current_sample.set(sample)
+                start = time.perf_counter()
+                try:
+                    sample.status = wsgi_post(
+                        application,
+                        SCENARIOS[operation.scenario][0],
+                        operation.body,
+                    )
+                finally:
+                    sample.latency = time.perf_counter() - start
+                    _current_sample.reset(token)
+                samples.append(sample)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, samples
+
+
+def run_asgi(
+    application, operations: List[Operation], concurrency: int
+) -> Tuple[float, List[Sample]]:
+    """Replay ``operations`` with at most ``concurrency`` in flight."""
+
+    async def replay():
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one(operation):
+            async with limit:
+                sample = Sample(operation.scenario, 0, 0.0, 0)
+                _current_sample.set(sample)
+                start = time.perf_counter()
+                sample.status = await asgi_post(
+                    application,
+                    SCENARIOS[operation.scenario][0],
+                    operation.body,
+                )
+                sample.latency = time.perf_counter() - start
+                return sample
+
+        # Each gather child runs in a copy of the context, so setting the
+        # sample in one() does not leak into its neighbours
+        start = time.perf_counter()
+        samples = await asyncio.gather(*map(one, operations))
+        return time.perf_counter() - start, list(samples)
+
+    return asyncio.run(replay())
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted ``values``."""
+    if not values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def _summarise(samples: List[Sample], elapsed: float) -> dict:
+    latencies = sorted(sample.latency * 1000 for sample in samples)
+    statuses: Dict[str, int] = {}
+    errors = 0
+    for sample in samples:
+        statuses[str(sample.status)] = statuses.get(str(sample.status), 0) + 1
+        if sample.status != SCENARIOS[sample.scenario][1]:
+            errors += 1
+    count = len(samples)
+    return {
+        "requests": count,
+        "errors": errors,
+        "statuses": statuses,
+        "rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "mean": round(sum(latencies) / count, 3) if count else 0.0,
+            "max": round(latencies[-1], 3) if count else 0.0,
+        },
+        "queries_per_request": (
+            round(sum(sample.queries for sample in samples) / count, 2)
+            if count
+            else 0.0
+        ),
+    }
+
+
+def summarise(samples: List[Sample], elapsed: float) -> dict:
+    """
+    Aggregate one run into the report layout: totals plus a breakdown
+    per scenario. Scenario rates share the wall time of the whole run.
+    """
+    report = _summarise(samples, elapsed)
+    report["elapsed_s"] = round(elapsed, 3)
+    by_scenario: Dict[str, List[Sample]] = {}
+    for sample in samples:
+        by_scenario.setdefault(sample.scenario, []).append(sample)
+    report["scenarios"] = {
+        name: _summarise(by_scenario[name], elapsed)
+        for name in sorted(by_scenario)
+    }
+    return report
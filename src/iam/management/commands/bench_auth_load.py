@@ -0,0 +1,214 @@
+import json
+import platform
+import random
+import subprocess
+import uuid
+
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from iam import loadtest
+from notification.clients import FakeSendGridClient, use_sendgrid_client
+
+APPS = ("wsgi", "asgi")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed bench users and replay a mixed token/refresh/register/"
+        "activation/verify workload through the WSGI and ASGI handlers, "
+        "reporting latency percentiles, req/s and queries per request as "
+        "JSON. Point it at a local Postgres; it only deletes what it seeds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument(
+            "--concurrency",
+            default="16",
+            help="Comma separated levels, each run separately (e.g. 1,16,64)",
+        )
+        parser.add_argument("--app", default=",".join(APPS))
+        parser.add_argument("--mix", default=loadtest.DEFAULT_MIX)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--email-latency-ms",
+            type=float,
+            default=0.0,
+            help="Simulated SendGrid round trip of the fake transport",
+        )
+        parser.add_argument(
+            "--output", default="-", help="Report path, '-' for stdout"
+        )
+        parser.add_argument(
+            "--compare", help="Earlier report to print the changes against"
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Leave the seeded rows"
+        )
+
+    def log(self, message):
+        # Progress goes to stderr when the report itself is on stdout
+        if self.report_to_stdout:
+            self.stderr.write(message, style_func=str)
+        else:
+            self.stdout.write(message)
+
+    def handle(self, *args, **options):
+        self.report_to_stdout = options["output"] == "-"
+        try:
+            mix = loadtest.parse_mix(options["mix"])
+            levels = [int(c) for c in options["concurrency"].split(",")]
+        except ValueError as e:
+            raise CommandError(e)
+        apps = [app.strip() for app in options["app"].split(",")]
+        if set(apps) - set(APPS):
+            raise CommandError(f"--app takes a subset of {', '.join(APPS)}")
+        if options["users"] < 1 or options["requests"] < 1:
+            raise CommandError("--users and --requests must be positive")
+        if min(levels) < 1:
+            raise CommandError("--concurrency levels must be positive")
+        if connection.vendor != "postgresql":
+            self.log(
+                f"Running against {connection.vendor}; numbers are only "
+                "comparable with Postgres runs"
+            )
+
+        counts = loadtest.plan_counts(mix, options["requests"])
+        transport = FakeSendGridClient(options["email_latency_ms"] / 1000)
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        results = {}
+        # Emails are sent inline through the fake transport rather than
+        # queued for a worker that isn't running. The Celery app reads its
+        # config from the CELERY_ settings, so that is where eager mode is
+        # switched on.
+        eager = override_settings(
+            CELERY_TASK_ALWAYS_EAGER=True, CELERY_TASK_EAGER_PROPAGATES=True
+        )
+        try:
+            with (
+                eager,
+                use_sendgrid_client(transport),
+                loadtest.sample_queries(),
+            ):
+                for app in apps:
+                    results[app] = {}
+                    for level in levels:
+                        run_prefix = f"{prefix}-{app}-c{level}"
+                        results[app][str(level)] = self.run(
+                            app, run_prefix, counts, level, options
+                        )
+        finally:
+            if not options["keep"]:
+                loadtest.cleanup(prefix)
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "created_at": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "users": options["users"],
+                "requests": options["requests"],
+                "mix": mix,
+                "seed": options["seed"],
+                "email_latency_ms": options["email_latency_ms"],
+                "emails_sent": transport.sent,
+            },
+            "results": results,
+        }
+        payload = json.dumps(report, indent=2, sort_keys=True)
+        if self.report_to_stdout:
+            self.stdout.write(payload)
+        else:
+            with open(options["output"], "w") as f:
+                f.write(payload + "\n")
+
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                self.compare(json.load(f), report)
+
+    def run(self, app, prefix, counts, concurrency, options):
+        fixtures = loadtest.seed(prefix, options["users"], counts)
+        operations = loadtest.build_operations(
+            fixtures, counts, random.Random(options["seed"])
+        )
+        # Every request comes from one IP; measure the views, not the
+        # throttles
+        overrides = {
+            "REST_FRAMEWORK": {
+                **settings.REST_FRAMEWORK,
+                "DEFAULT_THROTTLE_RATES": {},
+            }
+        }
+
+        with override_settings(**overrides):
+            if app == "asgi":
+                elapsed, samples = loadtest.run_asgi(
+                    ASGIHandler(), operations, concurrency
+                )
+            else:
+                elapsed, samples = loadtest.run_wsgi(
+                    WSGIHandler(), operations, concurrency
+                )
+
+        summary = loadtest.summarise(samples, elapsed)
+        latency = summary["latency_ms"]
+        self.log(
+            f"{app} c={concurrency}: {summary['rps']:.1f} req/s, "
+            f"p50 {latency['p50']:.1f}ms, p95 {latency['p95']:.1f}ms, "
+            f"p99 {latency['p99']:.1f}ms, "
+            f"{summary['queries_per_request']:.1f} queries/req, "
+            f"{summary['errors']} errors"
+        )
+        return summary
+
+    def compare(self, baseline, report):
+        commit = baseline["meta"].get("commit") or "baseline"
+        self.log(f"Changes against {commit[:12]}:")
+        for app, levels in report["results"].items():
+            for level, current in levels.items():
+                previous = baseline["results"].get(app, {}).get(level)
+                if previous is None:
+                    continue
+                for name in sorted(current["scenarios"]):
+                    old = previous["scenarios"].get(name)
+                    if old is None:
+                        continue
+                    new = current["scenarios"][name]
+                    rps = _change(old["rps"], new["rps"])
+                    p95 = _change(
+                        old["latency_ms"]["p95"], new["latency_ms"]["p95"]
+                    )
+                    self.log(
+                        f"  {app} c={level} {name}: rps {rps}, p95 {p95}, "
+                        f"queries/req {old['queries_per_request']} -> "
+                        f"{new['queries_per_request']}"
+                    )
+
+
+def _change(old, new):
+    if not old:
+        return f"{old} -> {new}"
+    return f"{(new - old) / old:+.1%}"
@@ -0,0 +1,74 @@
+import statistics
+import threading
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.db.pool import get_pool
+
+ENGINES = {
+    "direct": "django.db.backends.postgresql",
+    "pooled": "core.db.backends.postgresql_pool",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request connection setup with and without the "
+        "connection pool against the configured PostgreSQL database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--requests", type=int, default=200)
+
+    def handle(self, *args, **options):
+        settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+        for mode, engine in ENGINES.items():
+            alias = f"bench-{mode}"
+            latencies = []
+            start = time.perf_counter()
+            threads = [
+                threading.Thread(
+                    target=self.simulate_requests,
+                    args=(
+                        engine,
+                        {**settings_dict, "ENGINE": engine, "CONN_MAX_AGE": 0},
+                        alias,
+                        options["requests"],
+                        latencies,
+                    ),
+                )
+                for _ in range(options["threads"])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            quantiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f"{mode}: {len(latencies) / elapsed:,.0f} req/s, "
+                f"p50 {quantiles[49] * 1000:.2f}ms, "
+                f"p99 {quantiles[98] * 1000:.2f}ms"
+            )
+            if mode == "pooled":
+                pool = get_pool(alias, settings_dict.get("POOL", {}))
+                self.stdout.write(f"pool stats: {pool.stats()}")
+                pool.close()
+
+    @staticmethod
+    def simulate_requests(engine, settings_dict, alias, count, latencies):
+        # Each request runs one query and closes the connection, as
+        # Django does at the end of a request with CONN_MAX_AGE = 0.
+        backend = import_module(f"{engine}.base")
+        connection = backend.DatabaseWrapper(settings_dict, alias)
+        for _ in range(count):
+            start = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.close()
+            latencies.append(time.perf_counter() - start)
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+
+from core import metrics
+from core.metrics import MetricsMiddleware
+
+
+class Command(BaseCommand):
+    help = "Measure the per-request cost of MetricsMiddleware"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20000)
+
+    def handle(self, *args, **options):
+        if not metrics.is_enabled():
+            raise CommandError("prometheus_client missing or metrics off")
+
+        count = options["requests"]
+        request = RequestFactory().post("/api/auth/users/register/")
+        request.resolver_match = resolve(request.path)
+        request.query_count, request.query_duration = 3, 0.002
+        response = HttpResponse()
+
+        def view(request):
+            return response
+
+        results = {}
+        for label, handler in (
+            ("bare", view),
+            ("instrumented", MetricsMiddleware(view)),
+        ):
+            start = time.perf_counter()
+            for _ in range(count):
+                handler(request)
+            results[label] = (time.perf_counter() - start) / count
+
+        overhead = results["instrumented"] - results["bare"]
+        self.stdout.write(
+            f"MetricsMiddleware adds {overhead * 1e6:.1f}us per request "
+            f"({count} requests)"
+        )
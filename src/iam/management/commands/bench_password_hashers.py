@@ -0,0 +1,85 @@
+import os
+import random
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from iam import loadtest
+from iam.hashing import get_hashing_pool
+
+BACKENDS = {
+    "inline": "django.contrib.auth.backends.ModelBackend",
+    "pool": "iam.backends.PooledModelBackend",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Report logins/s, overall and per core, through the token endpoint "
+        "for each hasher, checking passwords inline and on the hashing "
+        "pool. Point it at a local Postgres; it only deletes what it seeds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--logins", type=int, default=40)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count() or 1
+        # Start the spawned workers before any run is timed
+        get_hashing_pool().submit(int).result()
+        self.stdout.write(
+            f"{cores} cores, {settings.IAM_HASHING_WORKERS} hashing "
+            f"workers, {options['concurrency']} concurrent clients"
+        )
+
+        for path in settings.PASSWORD_HASHERS:
+            algorithm = path.rsplit(".", 1)[-1]
+            with override_settings(PASSWORD_HASHERS=[path]):
+                hasher = get_hasher("default")
+                try:
+                    hasher.encode("bench", hasher.salt())
+                except ValueError as e:
+                    # Optional libraries such as argon2-cffi or bcrypt
+                    self.stdout.write(f"{algorithm}: skipped ({e})")
+                    continue
+
+                rates = []
+                for label, backend in BACKENDS.items():
+                    rps, errors = self.run(backend, options)
+                    rates.append(
+                        f"{label} {rps:,.1f} logins/s "
+                        f"({rps / cores:,.1f}/core, {errors} errors)"
+                    )
+            self.stdout.write(f"{algorithm}: " + ", ".join(rates))
+
+    def run(self, backend, options):
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        counts = {"token": options["logins"]}
+        try:
+            fixtures = loadtest.seed(prefix, options["users"], counts)
+            operations = loadtest.build_operations(
+                fixtures, counts, random.Random(options["seed"])
+            )
+            # Every request comes from one IP; measure the logins, not the
+            # throttles
+            with override_settings(
+                AUTHENTICATION_BACKENDS=[backend],
+                REST_FRAMEWORK={
+                    **settings.REST_FRAMEWORK,
+                    "DEFAULT_THROTTLE_RATES": {},
+                },
+            ):
+                elapsed, samples = loadtest.run_wsgi(
+                    WSGIHandler(), operations, options["concurrency"]
+                )
+        finally:
+            loadtest.cleanup(prefix)
+        summary = loadtest.summarise(samples, elapsed)
+        return summary["rps"], summary["errors"]
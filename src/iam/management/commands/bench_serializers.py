@@ -0,0 +1,163 @@
+import json
+import time
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import FastJSONRenderer
+from iam.models import User, UserVerification
+from iam.serializers import (
+    RefreshTokenSerializer,
+    UserReadSerializer,
+    UserSerializer,
+    UserVerificationSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the iam.serializers read and validation paths, and the JSON "
+        "renderers, over a seeded batch of users (rolled back afterwards)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Best of this many runs"
+        )
+
+    def best(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def report(self, label, elapsed, rows, baseline=None):
+        line = (
+            f"{label}: {rows / elapsed:,.0f} rows/s "
+            f"({elapsed * 1000:.1f}ms for {rows})"
+        )
+        if baseline:
+            line += f", {baseline / elapsed:.1f}x"
+        self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        count, repeat = options["users"], options["repeat"]
+        with transaction.atomic():
+            self.seed(count)
+            self.run(count, repeat)
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        password = make_password("bench-password")
+        users = User.objects.bulk_create(
+            User(
+                username=f"{prefix}-{i}@bench.invalid",
+                email=f"{prefix}-{i}@bench.invalid",
+                password=password,
+                is_active=True,
+            )
+            for i in range(count)
+        )
+        groups = Group.objects.bulk_create(
+            Group(name=f"{prefix}-{i}") for i in range(2)
+        )
+        User.groups.through.objects.bulk_create(
+            User.groups.through(user_id=user.pk, group_id=group.pk)
+            for user in users
+            for group in groups
+        )
+        UserVerification.objects.bulk_create(
+            UserVerification(user=user, token=uuid.uuid4().hex)
+            for user in users
+        )
+        self.prefix = prefix
+
+    def run(self, count, repeat):
+        users = list(
+            User.objects.filter(username__startswith=self.prefix)
+            .prefetch_related("groups", "user_permissions")
+            .order_by("-date_joined", "-uuid")
+        )
+        verifications = list(
+            UserVerification.objects.filter(
+                user__username__startswith=self.prefix
+            )
+        )
+
+        drf = UserSerializer(users, many=True).data
+        fast = UserReadSerializer(users, many=True).data
+        if json.loads(json.dumps(drf)) != json.loads(json.dumps(fast)):
+            raise CommandError(
+                "UserReadSerializer output differs from UserSerializer"
+            )
+
+        self.stdout.write("Serialization")
+        baseline = self.best(
+            lambda: UserSerializer(users, many=True).data, repeat
+        )
+        self.report("  UserSerializer", baseline, count)
+        elapsed = self.best(
+            lambda: UserReadSerializer(users, many=True).data, repeat
+        )
+        self.report("  UserReadSerializer", elapsed, count, baseline)
+        elapsed = self.best(
+            lambda: UserVerificationSerializer(verifications, many=True).data,
+            repeat,
+        )
+        self.report("  UserVerificationSerializer", elapsed, count)
+
+        self.stdout.write("Rendering")
+        renderers = (JSONRenderer(), FastJSONRenderer())
+        if json.loads(renderers[0].render(fast)) != json.loads(
+            renderers[1].render(fast)
+        ):
+            raise CommandError("FastJSONRenderer output differs")
+        baseline = self.best(lambda: renderers[0].render(fast), repeat)
+        self.report("  JSONRenderer", baseline, count)
+        elapsed = self.best(lambda: renderers[1].render(fast), repeat)
+        self.report("  FastJSONRenderer", elapsed, count, baseline)
+
+        self.stdout.write("List response (serialize + render)")
+        baseline = self.best(
+            lambda: renderers[0].render(UserSerializer(users, many=True).data),
+            repeat,
+        )
+        self.report("  UserSerializer + JSONRenderer", baseline, count)
+        elapsed = self.best(
+            lambda: renderers[1].render(
+                UserReadSerializer(users, many=True).data
+            ),
+            repeat,
+        )
+        self.report(
+            "  UserReadSerializer + FastJSONRenderer", elapsed, count, baseline
+        )
+
+        self.stdout.write("Validation")
+        payloads = [
+            {
+                "email": f"{self.prefix}-new{i}@bench.invalid",
+                "password": f"Bench-{uuid.uuid4()}",
+            }
+            for i in range(min(count, 200))
+        ]
+
+        def validate(serializer_class, rows):
+            for data in rows:
+                serializer_class(data=data).is_valid(raise_exception=True)
+
+        elapsed = self.best(lambda: validate(UserSerializer, payloads), repeat)
+        self.report("  UserSerializer", elapsed, len(payloads))
+        refresh = [{"refresh": uuid.uuid4().hex} for _ in range(count)]
+        elapsed = self.best(
+            lambda: validate(RefreshTokenSerializer, refresh), repeat
+        )
+        self.report("  RefreshTokenSerializer", elapsed, count)
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from iam.pruning import prune_expired_tokens, prune_unverified_users
+
+
+class Command(BaseCommand):
+    help = "Delete expired refresh tokens and stale unverified users"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=settings.IAM_PRUNE_CHUNK_SIZE
+        )
+        parser.add_argument(
+            "--skip-tokens",
+            action="store_true",
+            help="Do not prune expired refresh tokens",
+        )
+        parser.add_argument(
+            "--skip-users",
+            action="store_true",
+            help="Do not prune unverified users",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        removed = {}
+        if not options["skip_tokens"]:
+            removed.update(prune_expired_tokens(chunk_size))
+        if not options["skip_users"]:
+            for label, count in prune_unverified_users(chunk_size).items():
+                removed[label] = removed.get(label, 0) + count
+
+        if not removed:
+            self.stdout.write(self.style.WARNING("Nothing to prune"))
+        for label, count in sorted(removed.items()):
+            self.stdout.write(self.style.SUCCESS(f"Removed {count} {label}"))
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Indexes are built concurrently so the tables stay writable
+    atomic = False
+
+    dependencies = [
+        ("iam", "0002_alter_user_groups_alter_user_user_permissions"),
+        ("token_blacklist", "0012_alter_outstandingtoken_user"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="userverification",
+            index=models.Index(
+                condition=models.Q(("token__isnull", False)),
+                fields=["token"],
+                name="iam_userverif_token_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="userverification",
+            index=models.Index(
+                condition=models.Q(("is_verified", False)),
+                fields=["modified_at"],
+                name="iam_userverif_pending_idx",
+            ),
+        ),
+        # Expired-token sweeps; token_blacklist is a third-party app, so
+        # its index is managed here.
+        migrations.RunSQL(
+            sql=(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+                "token_blacklist_outstanding_expires_idx "
+                "ON token_blacklist_outstandingtoken (expires_at);"
+            ),
+            reverse_sql=(
+                "DROP INDEX CONCURRENTLY IF EXISTS "
+                "token_blacklist_outstanding_expires_idx;"
+            ),
+        ),
+    ]
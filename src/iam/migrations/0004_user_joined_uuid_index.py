@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:44
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("iam", "0003_userverification_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                fields=["date_joined", "uuid"], name="iam_user_joined_uuid_idx"
+            ),
+        ),
+    ]
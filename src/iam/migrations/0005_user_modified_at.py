@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-17 08:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("iam", "0004_user_joined_uuid_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="modified_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                help_text="The current datetime whenever the user is changed",
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -5,7 +5,12 @@ from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.db import models
 from django.utils import timezone
 
-from core.mixins import TimestampMixin, UUIDMixin
+from core.mixins import DirtyFieldsMixin, TimestampMixin, UUIDMixin
+
+
+def is_login_save(update_fields) -> bool:
+    """Whether a save only records a login (``update_last_login``)."""
+    return bool(update_fields) and set(update_fields) == {"last_login"}
 
 
 class User(AbstractUser, UUIDMixin):
@@ -18,17 +23,60 @@ class User(AbstractUser, UUIDMixin):
     user_permissions = models.ManyToManyField(
         Permission, related_name="customuser_set", blank=True
     )
+    modified_at = models.DateTimeField(
+        auto_now=True,
+        help_text="The current datetime whenever the user is changed",
+    )
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Keyset pagination of the user list
+            models.Index(
+                fields=["date_joined", "uuid"], name="iam_user_joined_uuid_idx"
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # modified_at backs the ETags of the user endpoints, so partial
+        # saves must move it too. Recording a login is not a change worth
+        # revalidating every client for.
+        update_fields = kwargs.get("update_fields")
+        if (
+            update_fields
+            and "modified_at" not in update_fields
+            and not is_login_save(update_fields)
+        ):
+            kwargs["update_fields"] = [*update_fields, "modified_at"]
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return self.email
 
 
-class UserVerification(TimestampMixin):
+class UserVerification(DirtyFieldsMixin, TimestampMixin):
     user = models.OneToOneField(User, on_delete=models.CASCADE, unique=True)
     token = models.CharField(max_length=64, null=True)
     verified_at = models.DateTimeField(null=True)
     is_verified = models.BooleanField(default=False)
 
+    tracked_fields = ("token",)
+
+    class Meta:
+        indexes = [
+            # Activation/reset token lookups
+            models.Index(
+                fields=["token"],
+                name="iam_userverif_token_idx",
+                condition=models.Q(token__isnull=False),
+            ),
+            # Expiry sweeps over records still awaiting activation
+            models.Index(
+                fields=["modified_at"],
+                name="iam_userverif_pending_idx",
+                condition=models.Q(is_verified=False),
+            ),
+        ]
+
     def is_expired(self) -> bool:
         expiry = self.modified_at + datetime.timedelta(
             hours=settings.USERTOKEN_EXPIRY_HOURS
@@ -0,0 +1,107 @@
+import base64
+import binascii
+import json
+import uuid
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class UserKeysetPagination(BasePagination):
+    """
+    Keyset pagination over users, newest first, keyed on
+    ``(date_joined, uuid)``.
+
+    Notes:
+    - Each page is a range scan on the (date_joined, uuid) index starting
+    after the last row of the previous page, so page N costs the same as
+    page 1.
+    - Only forward navigation (``next``) is offered.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = ("-date_joined", "-uuid")
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, user) -> str:
+        position = [user.date_joined.isoformat(), str(user.uuid)]
+        return base64.urlsafe_b64encode(
+            json.dumps(position).encode("ascii")
+        ).decode("ascii")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            date_joined, user_id = json.loads(
+                base64.urlsafe_b64decode(encoded.encode("ascii"))
+            )
+            date_joined = parse_datetime(date_joined)
+            user_id = uuid.UUID(user_id)
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if date_joined is None:
+            raise NotFound(self.invalid_cursor_message)
+        return date_joined, user_id
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            date_joined, user_id = position
+            # (date_joined, uuid) < position; the ``lte`` bound lets the
+            # planner start the index scan at the cursor
+            queryset = queryset.filter(date_joined__lte=date_joined).filter(
+                Q(date_joined__lt=date_joined) | Q(uuid__lt=user_id)
+            )
+
+        # One extra row tells us whether there is a next page
+        page = list(queryset[: page_size + 1])
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.next_position = page[-1] if page else None
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
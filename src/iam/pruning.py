@@ -0,0 +1,43 @@
+import datetime
+import logging
+from typing import Dict
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from core.db.utils import delete_in_chunks
+from iam.models import User
+
+logger = logging.getLogger(__name__)
+
+
+def prune_expired_tokens(chunk_size: int) -> Dict[str, int]:
+    """
+    Remove outstanding refresh tokens past their expiry, along with their
+    blacklist entries. An expired token is rejected on its own, so neither
+    row is needed anymore.
+    """
+    expired = OutstandingToken.objects.filter(expires_at__lt=timezone.now())
+    removed = delete_in_chunks(expired, chunk_size)
+    logger.info("Pruned expired tokens: %s", removed)
+    return removed
+
+
+def prune_unverified_users(chunk_size: int) -> Dict[str, int]:
+    """
+    Remove accounts that were never activated and whose verification record
+    has not been touched for IAM_UNVERIFIED_RETENTION_DAYS, freeing their
+    email for a fresh registration.
+    """
+    cutoff = timezone.now() - datetime.timedelta(
+        days=settings.IAM_UNVERIFIED_RETENTION_DAYS
+    )
+    stale = User.objects.filter(
+        is_active=False,
+        userverification__is_verified=False,
+        userverification__modified_at__lt=cutoff,
+    )
+    removed = delete_in_chunks(stale, chunk_size)
+    logger.info("Pruned unverified users: %s", removed)
+    return removed
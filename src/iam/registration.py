@@ -0,0 +1,85 @@
+import logging
+from typing import Dict, List
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.db import transaction
+
+from iam.models import User, UserVerification
+from notification.tasks import send_activation_emails
+
+logger = logging.getLogger(__name__)
+
+
+def register_users(rows: List[dict]) -> Dict[str, list]:
+    """
+    Create the accounts, and their activation tokens, for rows already
+    validated by BulkRegisterUserSerializer, and queue their activation
+    emails.
+
+    Each row carries its ``index`` in the original request and its
+    ``password`` already hashed, so that no plain password goes through the
+    broker or the job's stored arguments. Returns the
+    ``created`` rows (index, uuid, email) and, under ``errors``, the rows
+    whose email was registered since the request was validated.
+    """
+    pending = {row["email"]: row for row in rows}
+    errors = []
+    taken = User.objects.filter(email__in=pending).values_list(
+        "email", flat=True
+    )
+    for email in taken:
+        errors.append(
+            {
+                "index": pending.pop(email)["index"],
+                "errors": {"email": ["This field must be unique."]},
+            }
+        )
+
+    rows = list(pending.values())
+    users = [
+        User(
+            username=row["email"],
+            email=row["email"],
+            first_name=row.get("first_name", ""),
+            last_name=row.get("last_name", ""),
+            password=row["password"],
+        )
+        for row in rows
+    ]
+    verifications = [
+        UserVerification(
+            user=user, token=default_token_generator.make_token(user)
+        )
+        for user in users
+    ]
+
+    batch_size = settings.IAM_BULK_REGISTER_BATCH_SIZE
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=batch_size)
+        UserVerification.objects.bulk_create(
+            verifications, batch_size=batch_size
+        )
+        # bulk_create skips post_save, so activation emails are queued
+        # here, one job per SendGrid batch
+        recipients = [
+            [verification.user.email, verification.token]
+            for verification in verifications
+        ]
+        email_batch_size = settings.SENDGRID_BATCH_SIZE
+        for start in range(0, len(recipients), email_batch_size):
+            end = start + email_batch_size
+            batch = recipients[start:end]
+            transaction.on_commit(
+                lambda batch=batch: send_activation_emails.delay(batch)
+            )
+
+    logger.info(
+        "Bulk registered %d users, %d rejected", len(users), len(errors)
+    )
+    created = [
+        {"index": row["index"], "uuid": str(user.uuid), "email": user.email}
+        for row, user in zip(rows, users)
+    ]
+    errors.sort(key=lambda error: error["index"])
+    return {"created": created, "errors": errors}
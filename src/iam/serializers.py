@@ -1,12 +1,25 @@
+import uuid
+from operator import attrgetter
+
 import django.contrib.auth.password_validation as validators
 from django.contrib.auth.tokens import default_token_generator
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
 
+from iam.hashing import set_user_password
 from iam.models import User, UserVerification
+from iam.tokens import CachedRefreshToken
 
 
 class RefreshTokenSerializer(serializers.Serializer):
@@ -32,6 +45,56 @@ class RefreshTokenSerializer(serializers.Serializer):
         return value
 
 
+class CachedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Issues an access and refresh token pair for valid credentials.
+
+    Notes:
+    - The refresh token is a CachedRefreshToken, so its first refresh
+    finds it in the blacklist cache.
+    """
+
+    token_class = CachedRefreshToken
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Issues a new access (and rotated refresh) token from a refresh token.
+
+    Notes:
+    - Blacklist checks and the token's user are resolved through the cache,
+    so a refresh only writes the rotation rows to the database.
+    """
+
+    token_class = CachedRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+
+        if refresh.payload.get(api_settings.USER_ID_CLAIM):
+            user = refresh.get_user()
+            if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+                raise AuthenticationFailed(
+                    self.error_messages["no_active_account"],
+                    "no_active_account",
+                )
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+
+            data["refresh"] = str(refresh)
+
+        return data
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Manages user account creation and updates, including email, password,
@@ -74,14 +137,117 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def create(self, validated_data):
-        user = super().create(validated_data)
-        user.set_password(validated_data["password"])
-        user.username = user.email
+        password = validated_data.pop("password")
+        validated_data["username"] = validated_data["email"]
+        user = User(**validated_data)
+        set_user_password(user, password)
         user.save()
 
         return user
 
 
+def _datetime(value, tz):
+    # Same output as DRF's DateTimeField with the default ISO 8601 format
+    if value is None:
+        return None
+    value = value.astimezone(tz).isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def _related_pks(instance, name):
+    # Read prefetched rows straight from the cache; building a related
+    # manager per row costs more than the rest of the representation
+    cache = getattr(instance, "_prefetched_objects_cache", {})
+    if name in cache:
+        return [obj.pk for obj in cache[name]]
+    return [obj.pk for obj in getattr(instance, name).all()]
+
+
+class UserReadSerializer(serializers.BaseSerializer):
+    """
+    Read-only user representation for the list and retrieve endpoints.
+
+    Notes:
+    - Returns the same keys and formats as UserSerializer, but reads the
+    attributes directly instead of building and running a DRF field per
+    column, which dominates the cost of large user lists.
+    - ``fields`` limits the output to a subset of ``field_names``; only
+    those attributes are read, so the queryset can defer the rest.
+    - ``groups`` and ``user_permissions`` come from the prefetch cache
+    when the queryset prefetched them.
+    """
+
+    field_names = (
+        "uuid",
+        "email",
+        "last_login",
+        "is_superuser",
+        "username",
+        "first_name",
+        "last_name",
+        "is_staff",
+        "date_joined",
+        "is_active",
+        "modified_at",
+        "groups",
+        "user_permissions",
+    )
+    related_fields = ("groups", "user_permissions")
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Resolved once; with many=True this instance serializes every row
+        tz = timezone.get_current_timezone()
+        getters = {
+            "uuid": lambda user: str(user.uuid),
+            "last_login": lambda user: _datetime(user.last_login, tz),
+            "date_joined": lambda user: _datetime(user.date_joined, tz),
+            "modified_at": lambda user: _datetime(user.modified_at, tz),
+            "groups": lambda user: _related_pks(user, "groups"),
+            "user_permissions": lambda user: _related_pks(
+                user, "user_permissions"
+            ),
+        }
+        self.getters = [
+            (name, getters.get(name) or attrgetter(name))
+            for name in self.field_names
+            if fields is None or name in fields
+        ]
+
+    def to_representation(self, user):
+        return {name: getter(user) for name, getter in self.getters}
+
+
+class BulkRegisterUserSerializer(serializers.Serializer):
+    """
+    Validates a single row of a bulk registration request.
+
+    Validation:
+    - Ensures the email is well formed and the password conforms to
+    validation rules.
+
+    Notes:
+    - Email uniqueness is checked for the whole batch at once by the view.
+    """
+
+    email = serializers.EmailField(required=True, allow_blank=False)
+    password = serializers.CharField(
+        required=True,
+        write_only=True,
+        allow_blank=False,
+        validators=[validators.validate_password],
+        style={"input_type": "password"},
+    )
+    first_name = serializers.CharField(
+        required=False, allow_blank=True, max_length=150
+    )
+    last_name = serializers.CharField(
+        required=False, allow_blank=True, max_length=150
+    )
+
+
 class UserVerificationSerializer(serializers.ModelSerializer):
     """
     Verifies user tokens and checks whether they have expired.
@@ -121,21 +287,14 @@ class GenericRequestSerializer(serializers.Serializer):
     def validate(self, attrs):
         username = attrs.get("username")
 
-        try:
-            user = get_object_or_404(
-                User, username=username, is_active=self.should_be_verified
-            )
-            user_verification_record = get_object_or_404(
-                UserVerification,
-                user=user,
-                is_verified=self.should_be_verified,
-            )
-        except (User.DoesNotExist, UserVerification.DoesNotExist):
-            raise serializers.ValidationError(
-                {"username": "No valid user found"}
-            )
+        user_verification_record = get_object_or_404(
+            UserVerification.objects.select_related("user"),
+            user__username=username,
+            user__is_active=self.should_be_verified,
+            is_verified=self.should_be_verified,
+        )
 
-        attrs["user"] = user
+        attrs["user"] = user_verification_record.user
         attrs["user_verification_record"] = user_verification_record
         return attrs
 
@@ -154,9 +313,9 @@ class AccountActivationSerializer(serializers.Serializer):
         token = attrs.get("token")
 
         try:
-            user_verification_record = UserVerification.objects.get(
-                token=token
-            )
+            user_verification_record = UserVerification.objects.select_related(
+                "user"
+            ).get(token=token)
         except UserVerification.DoesNotExist:
             raise serializers.ValidationError({"token": "Invalid token"})
 
@@ -228,14 +387,17 @@ class ResetPasswordSerializer(serializers.Serializer):
         }
 
         try:
-            uid = force_str(urlsafe_base64_decode(uidb64))
-            user = User.objects.get(uuid=uid)
-        except (TypeError, ValueError, OverflowError, User.DoesNotExist):
-            user = None
+            uid = uuid.UUID(force_str(urlsafe_base64_decode(uidb64)))
+        except (TypeError, ValueError, OverflowError):
+            raise Http404
 
         user_verification_record = get_object_or_404(
-            UserVerification, user=user, token=token, is_verified=True
+            UserVerification.objects.select_related("user"),
+            user_id=uid,
+            token=token,
+            is_verified=True,
         )
+        user = user_verification_record.user
 
         if user_verification_record.is_expired():
             raise serializers.ValidationError({"token": "Token has expired"})
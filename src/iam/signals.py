@@ -1,16 +1,144 @@
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models import signals
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 
-from iam.models import UserVerification
-from notification.services import EmailService
+from iam.cache import (
+    claim_activation_email,
+    invalidate_cached_permissions,
+    invalidate_cached_user,
+    set_blacklist_state,
+)
+from iam.models import User, UserVerification, is_login_save
+from notification.tasks import send_activation_email
 
 
 @receiver(
     post_save, sender=UserVerification, dispatch_uid="send_verification_mail"
 )
-def send_verification_email(sender, instance, **kwargs):
-    if instance.is_verified:
+def send_verification_email(sender, instance, created, **kwargs):
+    # Only a new activation token is worth an email; saves that leave it
+    # alone (or clear it) send nothing
+    if instance.is_verified or not instance.token:
+        return
+    if "token" not in instance.saved_changes:
+        return
+    user_id, email, token = (
+        instance.user_id,
+        instance.user.email,
+        instance.token,
+    )
+
+    def send():
+        # Activation requests coalesce with this email until the cool-down
+        # ends. It starts only once the token is committed, so a failed
+        # save or a rollback doesn't hold back the next request.
+        claim_activation_email(user_id)
+        send_activation_email.delay(email, token)
+
+    transaction.on_commit(send)
+
+
+@receiver(post_save, sender=User, dispatch_uid="invalidate_user_cache_save")
+@receiver(
+    post_delete, sender=User, dispatch_uid="invalidate_user_cache_delete"
+)
+def invalidate_user_cache(sender, instance, update_fields=None, **kwargs):
+    # Logins don't move modified_at, so cached copies may keep the old
+    # last_login rather than being dropped on every token request
+    if is_login_save(update_fields):
+        return
+    # Drop the entry only once the write is visible to other connections,
+    # otherwise a concurrent request could re-cache the old row.
+    user_id = instance.uuid
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
+
+
+@receiver(
+    m2m_changed,
+    sender=User.groups.through,
+    dispatch_uid="invalidate_permissions_user_groups",
+)
+@receiver(
+    m2m_changed,
+    sender=User.user_permissions.through,
+    dispatch_uid="invalidate_permissions_user_permissions",
+)
+@receiver(
+    m2m_changed,
+    sender=Group.permissions.through,
+    dispatch_uid="invalidate_permissions_group_permissions",
+)
+def invalidate_permission_cache(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        transaction.on_commit(invalidate_cached_permissions)
+
+
+# The user representation lists group and permission ids, so membership
+# changes must move modified_at (and with it the ETags) as well
+
+
+@receiver(
+    m2m_changed,
+    sender=User.groups.through,
+    dispatch_uid="touch_users_user_groups",
+)
+@receiver(
+    m2m_changed,
+    sender=User.user_permissions.through,
+    dispatch_uid="touch_users_user_permissions",
+)
+def touch_users_on_membership_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if not reverse:
+        if action == "post_clear" or (
+            action in ("post_add", "post_remove") and pk_set
+        ):
+            touch_users(User.objects.filter(pk=instance.pk))
+    # Reversed, instance is the Group/Permission and pk_set holds users
+    elif action == "pre_clear":
+        touch_users(instance.customuser_set.all())
+    elif action in ("post_add", "post_remove") and pk_set:
+        touch_users(User.objects.filter(pk__in=pk_set))
+
+
+@receiver(
+    signals.pre_delete, sender=Group, dispatch_uid="touch_users_group_delete"
+)
+@receiver(
+    signals.pre_delete,
+    sender=Permission,
+    dispatch_uid="touch_users_permission_delete",
+)
+def touch_users_on_delete(sender, instance, **kwargs):
+    # The cascade drops the membership rows without m2m_changed
+    touch_users(instance.customuser_set.all())
+
+
+def touch_users(users):
+    # update() sends no post_save, so the cached users are dropped here
+    user_ids = list(users.values_list("uuid", flat=True))
+    if not user_ids:
         return
-    user, token = instance.user, instance.token
-    email_service = EmailService()
-    email_service.send_activation_mail(user.email, token)
+    User.objects.filter(uuid__in=user_ids).update(modified_at=timezone.now())
+
+    def invalidate():
+        for user_id in user_ids:
+            invalidate_cached_user(user_id)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(
+    post_save, sender=BlacklistedToken, dispatch_uid="cache_blacklisted_token"
+)
+def cache_blacklisted_token(sender, instance, created, **kwargs):
+    # Covers blacklisting done outside CachedRefreshToken (e.g. the admin)
+    if created:
+        outstanding = instance.token
+        exp = int(outstanding.expires_at.timestamp())
+        set_blacklist_state(outstanding.jti, True, exp)
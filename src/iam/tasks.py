@@ -0,0 +1,26 @@
+from celery import shared_task
+from django.conf import settings
+
+from iam.pruning import prune_expired_tokens, prune_unverified_users
+from iam.registration import register_users
+
+# The prune tasks are idempotent, so they are acknowledged only once they
+# finish and a worker lost mid-run hands them to another one.
+
+
+@shared_task(name="prune_expired_tokens", acks_late=True)
+def prune_expired_tokens_task(chunk_size=None):
+    """Delete expired outstanding and blacklisted refresh tokens."""
+    return prune_expired_tokens(chunk_size or settings.IAM_PRUNE_CHUNK_SIZE)
+
+
+@shared_task(name="prune_unverified_users", acks_late=True)
+def prune_unverified_users_task(chunk_size=None):
+    """Delete never-activated users with stale verification records."""
+    return prune_unverified_users(chunk_size or settings.IAM_PRUNE_CHUNK_SIZE)
+
+
+@shared_task(name="bulk_register_users", track_started=True)
+def bulk_register_users_task(rows):
+    """Insert and email the rows, passwords hashed, of a bulk registration."""
+    return register_users(rows)
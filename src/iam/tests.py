@@ -0,0 +1,1322 @@
+import base64
+import datetime
+import json
+import pickle
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from celery.contrib.testing.worker import start_worker
+from celery.result import AsyncResult
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import Group
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.routers import APIRootView
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from core.celery import app as celery_app
+from iam.cache import (
+    activation_email_cooling_down,
+    get_blacklist_state,
+    get_cached_user,
+    local_user_cache,
+    set_blacklist_state,
+    users,
+)
+from iam.hashing import (
+    HashingUnavailable,
+    get_hashing_pool,
+    hash_passwords,
+    verify_password,
+)
+from iam.models import User, UserVerification
+from iam.pruning import prune_expired_tokens, prune_unverified_users
+from iam.tasks import bulk_register_users_task
+from iam.throttling import ClientIPThrottle, UsernameThrottle
+from iam.tokens import CachedRefreshToken
+from notification.clients import FakeSendGridClient, use_sendgrid_client
+
+PASSWORD = "Budget-Test-1234"
+
+
+@contextmanager
+def memory_broker():
+    """Point the Celery app, and its producer pools, at an in-memory broker."""
+    broker_url = celery_app.conf.broker_url
+    celery_app.conf.update(CELERY_BROKER_URL="memory://")
+    try:
+        with (
+            mock.patch.object(celery_app, "_pool", None),
+            mock.patch.object(celery_app.amqp, "_producer_pool", None),
+        ):
+            yield
+    finally:
+        celery_app.conf.update(CELERY_BROKER_URL=broker_url)
+
+
+# (URL name, HTTP method) of every route a budget test covers
+BUDGET_TESTS = set()
+
+
+def budget_test(url_name: str, method: str):
+    """Mark a test as the query budget test of one route."""
+
+    def decorator(test):
+        BUDGET_TESTS.add((url_name, method))
+        return test
+
+    return decorator
+
+
+@contextmanager
+def shared_cache():
+    """Swap the process-local test cache for one all processes would see."""
+    with tempfile.TemporaryDirectory() as location:
+        backend = "django.core.cache.backends.filebased.FileBasedCache"
+        caches = {"default": {"BACKEND": backend, "LOCATION": location}}
+        with override_settings(CACHES=caches):
+            yield
+
+
+def iter_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_patterns(pattern.url_patterns)
+        else:
+            yield pattern
+
+
+def iam_routes():
+    """(URL name, HTTP method) of every view in iam.urls."""
+    routes = set()
+    for pattern in iter_patterns(get_resolver("iam.urls").url_patterns):
+        view_class = pattern.callback.cls
+        if issubclass(view_class, APIRootView):
+            continue
+        actions = getattr(pattern.callback, "actions", None)
+        methods = actions or {
+            method
+            for method in view_class.http_method_names
+            if hasattr(view_class, method)
+        }
+        routes.update(
+            (pattern.name, method)
+            for method in methods
+            if method not in ("options", "head")
+        )
+    return routes
+
+
+# Real transactions, so the views' atomic blocks don't become savepoints
+# (extra queries) as they would inside TestCase
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True, CELERY_TASK_EAGER_PROPAGATES=True
+)
+class QueryBudgetTests(TransactionTestCase):
+    """
+    Every route in iam.urls runs within its declared query budget.
+
+    QueryBudgetMiddleware only logs an exceeded budget, so these tests are
+    what holds the views to it.
+    """
+
+    def setUp(self):
+        # Throttle counters and cached users must not leak between tests
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.enterContext(use_sendgrid_client(FakeSendGridClient()))
+
+        self.admin = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            password=PASSWORD,
+            is_active=True,
+            is_staff=True,
+        )
+        self.client = APIClient()
+
+    def test_every_route_has_a_budget_test(self):
+        self.assertEqual(iam_routes() - BUDGET_TESTS, set())
+
+    def create_user(self, verified=False, token=None) -> User:
+        user = User.objects.create_user(
+            username="user@example.com",
+            email="user@example.com",
+            password=PASSWORD,
+            is_active=verified,
+        )
+        UserVerification.objects.create(
+            user=user, is_verified=verified, token=token
+        )
+        return user
+
+    def login(self):
+        access = AccessToken.for_user(self.admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def assertWithinBudget(
+        self, method, url_name, data=None, status=200, **kwargs
+    ):
+        url = reverse(url_name, kwargs=kwargs or None)
+        response = getattr(self.client, method)(url, data, format="json")
+        self.assertEqual(response.status_code, status, response.content)
+
+        request = response.wsgi_request
+        self.assertIsNotNone(
+            request.query_budget, f"{method.upper()} {url} has no budget"
+        )
+        self.assertLessEqual(
+            request.query_count,
+            request.query_budget,
+            f"{method.upper()} {url} ran over its query budget",
+        )
+        return response
+
+    @budget_test("token_obtain_pair", "post")
+    def test_token_obtain_pair(self):
+        self.assertWithinBudget(
+            "post",
+            "token_obtain_pair",
+            {"username": self.admin.username, "password": PASSWORD},
+        )
+
+    @budget_test("token_refresh", "post")
+    def test_token_refresh(self):
+        refresh = RefreshToken.for_user(self.admin)
+        self.assertWithinBudget(
+            "post", "token_refresh", {"refresh": str(refresh)}
+        )
+
+    @budget_test("token_verify", "post")
+    def test_token_verify(self):
+        access = AccessToken.for_user(self.admin)
+        self.assertWithinBudget("post", "token_verify", {"token": str(access)})
+
+    @budget_test("logout", "post")
+    def test_logout(self):
+        refresh = RefreshToken.for_user(self.admin)
+        self.assertWithinBudget("post", "logout", {"refresh": str(refresh)})
+
+    @budget_test("user-list", "get")
+    def test_user_list(self):
+        self.create_user()
+        self.login()
+        self.assertWithinBudget("get", "user-list")
+
+    @budget_test("user-list", "post")
+    def test_user_create(self):
+        self.login()
+        self.assertWithinBudget(
+            "post",
+            "user-list",
+            {"email": "user@example.com", "password": PASSWORD},
+            status=201,
+        )
+
+    @budget_test("user-detail", "get")
+    def test_user_retrieve(self):
+        user = self.create_user()
+        self.login()
+        self.assertWithinBudget("get", "user-detail", pk=user.pk)
+
+    @budget_test("user-detail", "put")
+    def test_user_update(self):
+        user = self.create_user()
+        self.login()
+        self.assertWithinBudget(
+            "put",
+            "user-detail",
+            {"email": user.email, "password": PASSWORD, "first_name": "A"},
+            pk=user.pk,
+        )
+
+    @budget_test("user-detail", "patch")
+    def test_user_partial_update(self):
+        user = self.create_user()
+        self.login()
+        self.assertWithinBudget(
+            "patch", "user-detail", {"first_name": "A"}, pk=user.pk
+        )
+
+    @budget_test("user-detail", "delete")
+    def test_user_destroy(self):
+        user = self.create_user()
+        self.login()
+        self.assertWithinBudget(
+            "delete", "user-detail", status=204, pk=user.pk
+        )
+
+    @budget_test("user-register", "post")
+    def test_user_register(self):
+        self.assertWithinBudget(
+            "post",
+            "user-register",
+            {"email": "user@example.com", "password": PASSWORD},
+            status=201,
+        )
+
+    @budget_test("user-bulk-register", "post")
+    def test_user_bulk_register(self):
+        self.login()
+        rows = [
+            {"email": f"user{i}@example.com", "password": PASSWORD}
+            for i in range(3)
+        ]
+        # The job runs in a worker, outside the request's budget
+        with mock.patch.object(bulk_register_users_task, "delay") as delay:
+            delay.return_value.id = str(uuid.uuid4())
+            self.assertWithinBudget(
+                "post", "user-bulk-register", rows, status=202
+            )
+
+    @budget_test("user-bulk-register-status", "get")
+    def test_user_bulk_register_status(self):
+        rows = [
+            {"index": 0, "email": "user@example.com", "password": PASSWORD}
+        ]
+        job = bulk_register_users_task.delay(rows)
+        self.login()
+        response = self.assertWithinBudget(
+            "get", "user-bulk-register-status", job_id=job.id
+        )
+        self.assertEqual(response.json()["status"], "SUCCESS")
+
+    @budget_test("user-verification-list", "get")
+    def test_verification_list(self):
+        self.create_user()
+        self.login()
+        self.assertWithinBudget("get", "user-verification-list")
+
+    @budget_test("user-verification-list", "post")
+    def test_verification_create(self):
+        user = User.objects.create_user(
+            username="user@example.com", email="user@example.com"
+        )
+        self.login()
+        self.assertWithinBudget(
+            "post",
+            "user-verification-list",
+            {
+                "user": user.pk,
+                "token": default_token_generator.make_token(user),
+            },
+            status=201,
+        )
+
+    @budget_test("user-verification-detail", "get")
+    def test_verification_retrieve(self):
+        user = self.create_user()
+        self.login()
+        self.assertWithinBudget(
+            "get", "user-verification-detail", pk=user.userverification.pk
+        )
+
+    @budget_test("user-verification-detail", "put")
+    def test_verification_update(self):
+        user = self.create_user()
+        self.login()
+        self.assertWithinBudget(
+            "put",
+            "user-verification-detail",
+            {
+                "user": user.pk,
+                "token": default_token_generator.make_token(user),
+            },
+            pk=user.userverification.pk,
+        )
+
+    @budget_test("user-verification-detail", "patch")
+    def test_verification_partial_update(self):
+        user = self.create_user()
+        self.login()
+        self.assertWithinBudget(
+            "patch",
+            "user-verification-detail",
+            {
+                "user": user.pk,
+                "token": default_token_generator.make_token(user),
+            },
+            pk=user.userverification.pk,
+        )
+
+    @budget_test("user-verification-detail", "delete")
+    def test_verification_destroy(self):
+        user = self.create_user()
+        self.login()
+        self.assertWithinBudget(
+            "delete",
+            "user-verification-detail",
+            status=204,
+            pk=user.userverification.pk,
+        )
+
+    @budget_test("user-verification-request-account-activation", "post")
+    def test_request_account_activation(self):
+        user = self.create_user()
+        self.assertWithinBudget(
+            "post",
+            "user-verification-request-account-activation",
+            {"username": user.username},
+        )
+
+    @budget_test("user-verification-account-verify", "post")
+    def test_account_verify(self):
+        user = self.create_user()
+        token = default_token_generator.make_token(user)
+        UserVerification.objects.filter(user=user).update(token=token)
+        self.assertWithinBudget(
+            "post", "user-verification-account-verify", {"token": token}
+        )
+
+    @budget_test("user-verification-request-account-reset", "post")
+    def test_request_account_reset(self):
+        user = self.create_user(verified=True)
+        self.assertWithinBudget(
+            "post",
+            "user-verification-request-account-reset",
+            {"username": user.username},
+        )
+
+    @budget_test("user-verification-account-reset", "post")
+    def test_account_reset(self):
+        user = self.create_user(verified=True)
+        token = default_token_generator.make_token(user)
+        UserVerification.objects.filter(user=user).update(token=token)
+        self.assertWithinBudget(
+            "post",
+            "user-verification-account-reset",
+            {
+                "password": "Budget-Test-5678",
+                "uidb64": urlsafe_base64_encode(force_bytes(user.uuid)),
+                "token": token,
+            },
+        )
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True, CELERY_TASK_EAGER_PROPAGATES=True
+)
+class BulkRegisterTests(TestCase):
+    def setUp(self):
+        self.transport = FakeSendGridClient()
+        self.enterContext(use_sendgrid_client(self.transport))
+
+        admin = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            is_active=True,
+            is_staff=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def test_rows_are_registered_by_the_job(self):
+        rows = [
+            {"email": "user0@example.com", "password": PASSWORD},
+            {"email": "admin@example.com", "password": PASSWORD},
+            {"email": "user1@example.com", "password": PASSWORD},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("user-bulk-register"), rows, format="json"
+            )
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(
+            [error["index"] for error in response.json()["errors"]], [1]
+        )
+
+        job_id = response.json()["job_id"]
+        self.assertEqual(
+            response["Location"],
+            reverse("user-bulk-register-status", args=[job_id]),
+        )
+        status = self.client.get(response["Location"]).json()
+        self.assertEqual(status["status"], "SUCCESS")
+        self.assertEqual([row["index"] for row in status["created"]], [0, 2])
+        user = User.objects.get(email="user1@example.com")
+        self.assertTrue(user.check_password(PASSWORD))
+        self.assertFalse(user.is_active)
+        self.assertTrue(UserVerification.objects.filter(user=user).exists())
+        self.assertEqual(self.transport.sent, 1)
+
+    def test_queued_rows_hold_only_password_hashes(self):
+        rows = [{"email": "user@example.com", "password": PASSWORD}]
+        with mock.patch.object(bulk_register_users_task, "delay") as delay:
+            delay.return_value.id = str(uuid.uuid4())
+            response = self.client.post(
+                reverse("user-bulk-register"), rows, format="json"
+            )
+
+        self.assertEqual(response.status_code, 202, response.content)
+        (queued,) = delay.call_args.args
+        self.assertNotIn(PASSWORD, json.dumps(queued))
+        self.assertTrue(check_password(PASSWORD, queued[0]["password"]))
+
+    def test_job_reports_emails_taken_since_the_request(self):
+        password = make_password(PASSWORD)
+        rows = [
+            {"index": 0, "email": "user@example.com", "password": password},
+            {"index": 1, "email": "admin@example.com", "password": password},
+        ]
+        result = bulk_register_users_task.delay(rows).get()
+
+        self.assertEqual([row["index"] for row in result["created"]], [0])
+        self.assertEqual([error["index"] for error in result["errors"]], [1])
+
+    def test_nothing_accepted_queues_no_job(self):
+        rows = [{"email": "admin@example.com", "password": PASSWORD}]
+        with mock.patch.object(bulk_register_users_task, "delay") as delay:
+            response = self.client.post(
+                reverse("user-bulk-register"), rows, format="json"
+            )
+
+        self.assertEqual(response.status_code, 400)
+        delay.assert_not_called()
+
+    def test_daemonic_process_hashes_inline(self):
+        # Celery's prefork children are daemonic and may not start a pool
+        daemon = mock.Mock(daemon=True)
+        with (
+            mock.patch("multiprocessing.current_process", return_value=daemon),
+            mock.patch("iam.hashing.get_hashing_pool") as get_hashing_pool,
+        ):
+            (password,) = hash_passwords([PASSWORD])
+
+        get_hashing_pool.assert_not_called()
+        self.assertTrue(check_password(PASSWORD, password))
+
+
+class BulkRegisterWorkerTests(TransactionTestCase):
+    """The job runs in a Celery worker, not eagerly in the request."""
+
+    def setUp(self):
+        self.transport = FakeSendGridClient()
+        self.enterContext(use_sendgrid_client(self.transport))
+        self.enterContext(memory_broker())
+        self.enterContext(
+            start_worker(celery_app, pool="solo", perform_ping_check=False)
+        )
+
+        admin = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            is_active=True,
+            is_staff=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def test_worker_registers_the_rows(self):
+        rows = [{"email": "user@example.com", "password": PASSWORD}]
+        response = self.client.post(
+            reverse("user-bulk-register"), rows, format="json"
+        )
+        self.assertEqual(response.status_code, 202, response.content)
+
+        AsyncResult(response.json()["job_id"]).get(timeout=30)
+        status = self.client.get(response["Location"]).json()
+        self.assertEqual(status["status"], "SUCCESS")
+        user = User.objects.get(email="user@example.com")
+        self.assertTrue(user.check_password(PASSWORD))
+
+
+class HashingTests(TestCase):
+    """Logins check passwords on the bounded hashing pool."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username="user@example.com",
+            email="user@example.com",
+            is_active=True,
+        )
+
+    def login(self):
+        return APIClient().post(
+            reverse("token_obtain_pair"),
+            {"username": self.user.username, "password": PASSWORD},
+            format="json",
+        )
+
+    def test_login_rehashes_an_outdated_password(self):
+        self.user.password = make_password(PASSWORD, hasher="pbkdf2_sha1")
+        self.user.save(update_fields=["password"])
+
+        response = self.login()
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+        self.assertTrue(self.user.check_password(PASSWORD))
+
+    def test_wrong_password_is_rejected(self):
+        self.user.set_password("Another-Pass-1234")
+        self.user.save(update_fields=["password"])
+
+        self.assertEqual(self.login().status_code, 401)
+
+    @override_settings(IAM_HASHING_QUEUE_TIMEOUT=0)
+    def test_full_pool_turns_logins_away(self):
+        self.user.set_password(PASSWORD)
+        self.user.save(update_fields=["password"])
+        get_hashing_pool()
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+
+        with mock.patch("iam.hashing._slots", slots):
+            response = self.login()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(
+            response.json()["detail"], HashingUnavailable.default_detail
+        )
+
+    def test_daemonic_process_verifies_inline(self):
+        encoded = make_password(PASSWORD)
+        daemon = mock.Mock(daemon=True)
+        with (
+            mock.patch("multiprocessing.current_process", return_value=daemon),
+            mock.patch("iam.hashing.get_hashing_pool") as get_hashing_pool,
+        ):
+            self.assertEqual(verify_password(PASSWORD, encoded), (True, None))
+
+        get_hashing_pool.assert_not_called()
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True, CELERY_TASK_EAGER_PROPAGATES=True
+)
+class RegisterThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.enterContext(use_sendgrid_client(FakeSendGridClient()))
+
+        # A per-email limit, were the view to apply one, would trip first
+        rates = {"register_ip": "2/hour", "register_username": "1/hour"}
+        rest_framework = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": rates,
+            "NUM_PROXIES": 1,
+        }
+        self.enterContext(override_settings(REST_FRAMEWORK=rest_framework))
+
+    def register(self, email, forwarded_for):
+        return APIClient().post(
+            reverse("user-register"),
+            {"email": email, "password": PASSWORD},
+            format="json",
+            HTTP_X_FORWARDED_FOR=forwarded_for,
+        )
+
+    def test_keyed_on_the_address_the_proxy_appended(self):
+        statuses = [
+            self.register(
+                f"user{i}@example.com", f"10.0.0.{i}, 203.0.113.7"
+            ).status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses, [201, 201, 429])
+
+    def test_not_keyed_on_the_email(self):
+        statuses = [
+            self.register("user@example.com", f"203.0.113.{i}").status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses, [201, 400, 400])
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True, CELERY_TASK_EAGER_PROPAGATES=True
+)
+class ActivationEmailTests(TestCase):
+    """Activation requests coalesce with an email sent moments ago."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.transport = FakeSendGridClient()
+        self.enterContext(use_sendgrid_client(self.transport))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user(
+                username="user@example.com", email="user@example.com"
+            )
+            UserVerification.objects.create(
+                user=self.user, token=uuid.uuid4().hex
+            )
+
+    def token(self):
+        return UserVerification.objects.get(user=self.user).token
+
+    def request_activation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return APIClient().post(
+                reverse("user-verification-request-account-activation"),
+                {"username": self.user.username},
+                format="json",
+            )
+
+    def test_request_during_the_cooldown_reuses_the_last_email(self):
+        self.assertEqual(self.transport.sent, 1)
+        token = self.token()
+
+        response = self.request_activation()
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.transport.sent, 1)
+        self.assertEqual(self.token(), token)
+
+    def test_request_after_the_cooldown_rotates_the_token(self):
+        token = self.token()
+        cache.clear()
+
+        for _ in range(2):
+            response = self.request_activation()
+            self.assertEqual(response.status_code, 200, response.content)
+
+        self.assertEqual(self.transport.sent, 2)
+        self.assertNotEqual(self.token(), token)
+
+    def test_cooldown_starts_when_the_token_is_committed(self):
+        cache.clear()
+        verification = UserVerification.objects.get(user=self.user)
+        verification.token = uuid.uuid4().hex
+        with self.captureOnCommitCallbacks() as callbacks:
+            verification.save()
+        self.assertFalse(activation_email_cooling_down(self.user.pk))
+
+        for callback in callbacks:
+            callback()
+        self.assertTrue(activation_email_cooling_down(self.user.pk))
+
+    def test_failed_save_does_not_start_the_cooldown(self):
+        cache.clear()
+        with (
+            mock.patch.object(
+                UserVerification, "save", side_effect=DatabaseError
+            ),
+            self.assertLogs("iam.views", "ERROR"),
+        ):
+            response = self.request_activation()
+        self.assertEqual(response.status_code, 500)
+
+        response = self.request_activation()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.transport.sent, 2)
+
+
+class SlidingWindowThrottleTests(TestCase):
+    """The throttles against a fixed clock, 30 seconds into a window."""
+
+    rates = {"test_ip": "4/min", "test_username": "2/min"}
+    view = SimpleNamespace(throttle_scope="test")
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        rest_framework = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": self.rates,
+            "NUM_PROXIES": 1,
+        }
+        self.enterContext(override_settings(REST_FRAMEWORK=rest_framework))
+        self.now = 6000.0 + 30
+
+    def request(self, forwarded_for="203.0.113.7", **data):
+        request = APIRequestFactory().post(
+            "/", data, format="json", HTTP_X_FORWARDED_FOR=forwarded_for
+        )
+        return Request(request, parsers=[JSONParser()])
+
+    def check(self, throttle_class, request):
+        throttle = throttle_class()
+        throttle.timer = lambda: self.now
+        self.throttle = throttle
+        return throttle.allow_request(request, self.view)
+
+    def allowed(self, throttle_class=ClientIPThrottle, attempts=10, **kw):
+        return sum(
+            self.check(throttle_class, self.request(**kw))
+            for _ in range(attempts)
+        )
+
+    def test_full_window_waits_for_it_to_slide(self):
+        self.assertEqual(self.allowed(), 4)
+        # All four fall in this window, so the next request may go once
+        # it ends and they start sliding out
+        self.assertEqual(self.throttle.wait(), 30)
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        self.assertEqual(self.allowed(), 4)
+
+        # A quarter into the next window, 3 of the 4 still count
+        self.now = 6060.0 + 15
+        self.assertEqual(self.allowed(), 1)
+        # Halfway, 2 do
+        self.now = 6060.0 + 30
+        self.assertEqual(self.allowed(), 1)
+        self.now = 6060.0 + 45
+        self.assertEqual(self.allowed(), 1)
+
+    def test_counts_roll_over_after_two_windows(self):
+        self.assertEqual(self.allowed(), 4)
+        # The first moment of the next window still sees them all
+        self.now = 6060.0
+        self.assertEqual(self.allowed(), 0)
+
+        self.now = 6120.0
+        self.assertEqual(self.allowed(), 4)
+
+    def test_scope_without_a_rate_is_not_throttled(self):
+        self.view = SimpleNamespace(throttle_scope="other")
+        self.assertEqual(self.allowed(), 10)
+
+    def test_username_is_shared_across_addresses_and_spellings(self):
+        spellings = [
+            "user@example.com",
+            " USER@example.com ",
+            "User@Example.com",
+        ]
+        allowed = [
+            self.check(
+                UsernameThrottle,
+                self.request(f"203.0.113.{i}", username=username),
+            )
+            for i, username in enumerate(spellings)
+        ]
+        self.assertEqual(allowed, [True, True, False])
+        self.assertEqual(
+            self.allowed(UsernameThrottle, username="other@example.com"), 2
+        )
+
+    def test_request_without_a_username_is_left_to_the_ip_throttle(self):
+        self.assertEqual(self.allowed(UsernameThrottle), 10)
+        self.assertEqual(self.allowed(UsernameThrottle, username=" "), 10)
+
+    def test_client_ip_is_the_one_the_proxy_appended(self):
+        allowed = [
+            self.check(
+                ClientIPThrottle, self.request(f"10.0.0.{i}, 203.0.113.7")
+            )
+            for i in range(5)
+        ]
+        self.assertEqual(allowed, [True] * 4 + [False])
+        self.assertEqual(self.allowed(forwarded_for="203.0.113.8"), 4)
+
+    def test_more_proxies_read_further_back(self):
+        rest_framework = {**settings.REST_FRAMEWORK, "NUM_PROXIES": 2}
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            request = self.request("10.0.0.1, 203.0.113.7, 198.51.100.1")
+            self.assertEqual(
+                ClientIPThrottle().get_ident(request), "203.0.113.7"
+            )
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        local_user_cache.clear()
+        self.addCleanup(local_user_cache.clear)
+        self.user = User.objects.create_user(
+            username="user@example.com",
+            email="user@example.com",
+            password=PASSWORD,
+            is_active=True,
+        )
+
+    def test_process_local_backend_reads_the_database(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(get_cached_user(self.user.pk), self.user)
+
+    def test_shared_backend_caches_without_the_password(self):
+        with shared_cache():
+            get_cached_user(self.user.pk)
+            local_user_cache.clear()
+            with self.assertNumQueries(0):
+                user = get_cached_user(self.user.pk)
+
+            self.assertIn("password", user.get_deferred_fields())
+            entry = users.cache.get(users.key(self.user.pk))
+            self.assertNotIn(self.user.password.encode(), pickle.dumps(entry))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.save(update_fields=["first_name"])
+            with self.assertNumQueries(1):
+                get_cached_user(self.user.pk)
+
+    def test_membership_change_drops_the_cached_user(self):
+        group = Group.objects.create(name="staff")
+        with shared_cache():
+            cached = get_cached_user(self.user.pk)
+            local_user_cache.clear()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.groups.add(group)
+
+            with self.assertNumQueries(1):
+                user = get_cached_user(self.user.pk)
+            self.assertGreater(user.modified_at, cached.modified_at)
+
+
+class BlacklistCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="user@example.com",
+            email="user@example.com",
+            password=PASSWORD,
+            is_active=True,
+        )
+
+    def check(self, token, queries):
+        # Decoding a token checks the blacklist
+        with self.assertNumQueries(queries):
+            CachedRefreshToken(str(token))
+
+    def test_process_local_backend_only_caches_blacklisted(self):
+        token = CachedRefreshToken.for_user(self.user)
+        self.check(token, 1)
+        self.check(token, 1)
+
+        CachedRefreshToken(str(token)).blacklist()
+        with self.assertRaises(TokenError):
+            self.check(token, 0)
+
+    def test_shared_backend_caches_issued_tokens(self):
+        with shared_cache():
+            token = CachedRefreshToken.for_user(self.user)
+            self.check(token, 0)
+
+            # Blacklisted elsewhere, e.g. through the admin
+            BlacklistedToken.objects.create(
+                token=OutstandingToken.objects.get(jti=token["jti"])
+            )
+            with self.assertRaises(TokenError):
+                self.check(token, 0)
+
+    def test_not_blacklisted_never_overwrites_blacklisted(self):
+        with shared_cache():
+            token = CachedRefreshToken.for_user(self.user)
+            jti, exp = token["jti"], token["exp"]
+            set_blacklist_state(jti, True, exp)
+            set_blacklist_state(jti, False, exp)
+            self.assertIs(get_blacklist_state(jti), True)
+
+
+@skipUnless(connection.vendor == "postgresql", "Postgres query plans")
+class UserListTestCase(TestCase):
+    """Admin client and a few users to page through."""
+
+    def setUp(self):
+        admin = User.objects.create_user(
+            username="admin@example.com",
+            email="admin@example.com",
+            is_active=True,
+            is_staff=True,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        for i in range(5):
+            User.objects.create_user(
+                username=f"user{i}@example.com", email=f"user{i}@example.com"
+            )
+
+    def expected_order(self):
+        return list(
+            User.objects.order_by("-date_joined", "-uuid").values_list(
+                "email", flat=True
+            )
+        )
+
+    def get_list(self, **params):
+        response = self.client.get(reverse("user-list"), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def walk(self, **params):
+        """Emails of every page, following ``next`` to the end."""
+        emails, url = [], None
+        response = self.get_list(**params)
+        while True:
+            data = response.json()
+            emails.extend(user["email"] for user in data["results"])
+            url = data["next"]
+            if url is None:
+                return emails
+            response = self.client.get(url)
+
+
+class UserPaginationTests(UserListTestCase):
+    def test_cursor_walks_every_user_once_newest_first(self):
+        self.assertEqual(self.walk(page_size=2), self.expected_order())
+
+    def test_ties_on_date_joined_are_broken_by_uuid(self):
+        User.objects.update(date_joined=timezone.now())
+        emails = self.walk(page_size=2)
+
+        self.assertEqual(emails, self.expected_order())
+        self.assertEqual(len(set(emails)), User.objects.count())
+
+    def test_last_page_has_no_next(self):
+        data = self.get_list(page_size=User.objects.count()).json()
+        self.assertIsNone(data["next"])
+
+    def test_bad_cursor_is_a_404(self):
+        def encode(value):
+            return base64.urlsafe_b64encode(value.encode()).decode()
+
+        for cursor in (
+            "not base64!",
+            encode("not json"),
+            encode('["not a date", "%s"]' % uuid.uuid4()),
+            encode('["2024-01-01T00:00:00+00:00", "not a uuid"]'),
+            encode('"just a string"'),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    reverse("user-list"), {"cursor": cursor}
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_stream_returns_every_user_as_json_lines(self):
+        response = self.client.get(reverse("user-list"), {"stream": 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        emails = [json.loads(line)["email"] for line in lines]
+        self.assertEqual(emails, self.expected_order())
+
+
+class UserFieldsTests(UserListTestCase):
+    """?fields= on the list and retrieve endpoints."""
+
+    def test_list_returns_only_the_requested_fields(self):
+        results = self.get_list(fields="email, uuid").json()["results"]
+
+        self.assertTrue(results)
+        for user in results:
+            self.assertEqual(set(user), {"uuid", "email"})
+
+    def test_retrieve_returns_only_the_requested_fields(self):
+        user = User.objects.get(email="user0@example.com")
+        response = self.client.get(
+            reverse("user-detail", args=[user.pk]), {"fields": "groups"}
+        )
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json(), {"groups": []})
+
+    def test_unknown_or_empty_fields_are_a_400(self):
+        user = User.objects.get(email="user0@example.com")
+        for url in (
+            reverse("user-list"),
+            reverse("user-detail", args=[user.pk]),
+        ):
+            for fields in ("email,password", " , "):
+                with self.subTest(url=url, fields=fields):
+                    response = self.client.get(url, {"fields": fields})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("fields", response.json())
+
+    def test_cursor_keeps_the_fields_across_pages(self):
+        emails = self.walk(fields="email", page_size=2)
+        self.assertEqual(emails, self.expected_order())
+
+        data = self.get_list(fields="email", page_size=2).json()
+        next_page = self.client.get(data["next"]).json()
+        self.assertEqual(set(next_page["results"][0]), {"email"})
+
+    def test_stream_returns_only_the_requested_fields(self):
+        response = self.client.get(
+            reverse("user-list"), {"stream": 1, "fields": "email"}
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{"email": email} for email in self.expected_order()],
+        )
+
+    def test_etag_depends_on_the_fields(self):
+        user = User.objects.get(email="user0@example.com")
+        for url in (
+            reverse("user-list"),
+            reverse("user-detail", args=[user.pk]),
+        ):
+            with self.subTest(url=url):
+                etag = self.client.get(url, {"fields": "email"})["ETag"]
+                self.assertNotEqual(self.client.get(url)["ETag"], etag)
+
+                response = self.client.get(
+                    url, {"fields": "email"}, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 304)
+                response = self.client.get(
+                    url, {"fields": "uuid"}, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+
+
+class UserETagTests(UserListTestCase):
+    """The list ETag follows the page's rows, not the whole table."""
+
+    def get_first_page(self, **headers):
+        return self.client.get(
+            reverse("user-list"), {"page_size": 2}, **headers
+        )
+
+    def rename(self, email):
+        user = User.objects.get(email=email)
+        user.first_name = "Renamed"
+        user.save(update_fields=["first_name"])
+
+    def test_write_outside_the_page_keeps_the_etag(self):
+        etag = self.get_first_page()["ETag"]
+        self.rename("user0@example.com")
+
+        response = self.get_first_page(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_write_within_the_page_changes_the_etag(self):
+        etag = self.get_first_page()["ETag"]
+        self.rename(self.expected_order()[1])
+
+        response = self.get_first_page(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_new_user_changes_the_first_page(self):
+        etag = self.get_first_page()["ETag"]
+        User.objects.create_user(
+            username="new@example.com", email="new@example.com"
+        )
+
+        response = self.get_first_page(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_revalidation_reads_only_the_page(self):
+        etag = self.get_first_page()["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_first_page(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        (query,) = queries.captured_queries
+        self.assertNotIn("COUNT(", query["sql"])
+        self.assertIn("LIMIT 3", query["sql"])
+
+    def test_login_does_not_move_modified_at(self):
+        user = User.objects.get(email="user0@example.com")
+        modified_at = user.modified_at
+        user.last_login = timezone.now()
+        with (
+            mock.patch("iam.signals.invalidate_cached_user") as invalidate,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            user.save(update_fields=["last_login"])
+
+        invalidate.assert_not_called()
+        user.refresh_from_db()
+        self.assertEqual(user.modified_at, modified_at)
+        self.assertIsNotNone(user.last_login)
+
+        with (
+            mock.patch("iam.signals.invalidate_cached_user") as invalidate,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            user.save(update_fields=["last_login", "first_name"])
+
+        invalidate.assert_called_once_with(user.uuid)
+        user.refresh_from_db()
+        self.assertGreater(user.modified_at, modified_at)
+
+
+class PruningTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def create_unverified(self, email: str, idle_days: int) -> User:
+        user = User.objects.create(username=email, email=email)
+        UserVerification.objects.create(user=user, token=email)
+        # modified_at is auto_now, so it is backdated with update()
+        UserVerification.objects.filter(user=user).update(
+            modified_at=self.now - datetime.timedelta(days=idle_days)
+        )
+        return user
+
+    def create_token(self, jti: str, expires_in_days: int):
+        return OutstandingToken.objects.create(
+            jti=jti,
+            token=jti,
+            expires_at=self.now + datetime.timedelta(days=expires_in_days),
+        )
+
+    def test_expired_tokens_go_with_their_blacklist_entries(self):
+        expired = self.create_token("expired", -1)
+        BlacklistedToken.objects.create(token=expired)
+        self.create_token("fresh", 1)
+
+        removed = prune_expired_tokens(chunk_size=1)
+
+        self.assertEqual(
+            removed,
+            {
+                "token_blacklist.BlacklistedToken": 1,
+                "token_blacklist.OutstandingToken": 1,
+            },
+        )
+        self.assertQuerySetEqual(
+            OutstandingToken.objects.values_list("jti", flat=True), ["fresh"]
+        )
+
+    def test_unverified_users_go_after_the_retention_period(self):
+        days = settings.IAM_UNVERIFIED_RETENTION_DAYS
+        self.create_unverified("stale@example.com", days + 1)
+        self.create_unverified("recent@example.com", days - 1)
+        active = self.create_unverified("active@example.com", days + 1)
+        User.objects.filter(pk=active.pk).update(is_active=True)
+
+        removed = prune_unverified_users(chunk_size=1)
+
+        self.assertEqual(removed["iam.User"], 1)
+        self.assertQuerySetEqual(
+            User.objects.order_by("email").values_list("email", flat=True),
+            ["active@example.com", "recent@example.com"],
+        )
+
+    def test_user_activated_mid_sweep_is_kept(self):
+        user = self.create_unverified(
+            "late@example.com", settings.IAM_UNVERIFIED_RETENTION_DAYS + 1
+        )
+        activated = []
+
+        def activate_after_select(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if not activated and sql.startswith("SELECT"):
+                activated.append(sql)
+                User.objects.filter(pk=user.pk).update(is_active=True)
+            return result
+
+        with connection.execute_wrapper(activate_after_select):
+            removed = prune_unverified_users(chunk_size=10)
+
+        self.assertEqual(removed, {})
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+    def test_sweep_stops_when_a_chunk_deletes_nothing(self):
+        self.create_token("expired", -1)
+        with mock.patch.object(QuerySet, "delete", return_value=(0, {})):
+            self.assertEqual(prune_expired_tokens(chunk_size=10), {})
+
+    def test_command_reports_what_it_removed(self):
+        self.create_token("expired", -1)
+        self.create_unverified(
+            "stale@example.com", settings.IAM_UNVERIFIED_RETENTION_DAYS + 1
+        )
+        out = StringIO()
+
+        call_command("prune_auth_tables", stdout=out)
+
+        self.assertIn("Removed 1 iam.User", out.getvalue())
+        self.assertIn(
+            "Removed 1 token_blacklist.OutstandingToken", out.getvalue()
+        )
+        out = StringIO()
+        call_command("prune_auth_tables", stdout=out)
+        self.assertIn("Nothing to prune", out.getvalue())
+
+
+class QueryPlanTests(TestCase):
+    """The token lookups and cleanup sweeps use their indexes."""
+
+    rows = 5000
+
+    @classmethod
+    def setUpTestData(cls):
+        # Mostly active accounts, a few pending activation and a few
+        # expired tokens, the shape the sweeps run against
+        now = timezone.now()
+        users = User.objects.bulk_create(
+            User(
+                username=f"user{i}@example.com",
+                email=f"user{i}@example.com",
+                is_active=i % 50 != 0,
+            )
+            for i in range(cls.rows)
+        )
+        UserVerification.objects.bulk_create(
+            UserVerification(
+                user=user,
+                is_verified=user.is_active,
+                token=None if user.is_active else uuid.uuid4().hex,
+            )
+            for user in users
+        )
+        OutstandingToken.objects.bulk_create(
+            OutstandingToken(
+                user=user,
+                jti=uuid.uuid4().hex,
+                token="",
+                expires_at=now + datetime.timedelta(days=1 if i % 50 else -1),
+            )
+            for i, user in enumerate(users)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "ANALYZE iam_user, iam_userverification, "
+                "token_blacklist_outstandingtoken"
+            )
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f"Index Scan using {index}", plan, plan)
+
+    def test_token_lookup(self):
+        self.assertUsesIndex(
+            UserVerification.objects.filter(token=uuid.uuid4().hex),
+            "iam_userverif_token_idx",
+        )
+
+    def test_unverified_user_sweep(self):
+        cutoff = timezone.now() - datetime.timedelta(
+            days=settings.IAM_UNVERIFIED_RETENTION_DAYS
+        )
+        stale = User.objects.filter(
+            is_active=False,
+            userverification__is_verified=False,
+            userverification__modified_at__lt=cutoff,
+        )
+        self.assertUsesIndex(
+            stale.order_by("pk").values_list("pk", flat=True)[:1000],
+            "iam_userverif_pending_idx",
+        )
+
+    def test_expired_token_sweep(self):
+        expired = OutstandingToken.objects.filter(
+            expires_at__lt=timezone.now()
+        )
+        self.assertUsesIndex(
+            expired.order_by("pk").values_list("pk", flat=True)[:1000],
+            "token_blacklist_outstanding_expires_idx",
+        )
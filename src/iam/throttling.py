@@ -0,0 +1,119 @@
+import hashlib
+
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from core.cache import CacheNamespace
+
+throttles = CacheNamespace("iam:throttle")
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Rate throttle over a sliding window approximated by two fixed-window
+    counters.
+
+    Notes:
+    - The previous window's count is weighted by how much of it still
+    overlaps the sliding window, so each check is one ``get_many`` plus one
+    increment whatever the rate, instead of DRF's per-request timestamp
+    list.
+    - The rate comes from ``DEFAULT_THROTTLE_RATES["<scope>_<kind>"]``,
+    where the scope is the view's ``throttle_scope``. A view without a
+    scope, or a scope without a rate, is not throttled.
+    """
+
+    kind = None
+
+    def __init__(self):
+        # Rates are resolved per view in allow_request
+        pass
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(
+            f"{self.scope}_{self.kind}"
+        )
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, "throttle_scope", None)
+        self.rate = self.get_rate() if self.scope else None
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        ident = self.get_cache_key(request, view)
+        if ident is None:
+            return True
+
+        window, elapsed = divmod(self.timer(), self.duration)
+        window = int(window)
+        current_key = throttles.key(f"{self.scope}:{ident}:{window}")
+        previous_key = throttles.key(f"{self.scope}:{ident}:{window - 1}")
+        counts = self.cache.get_many([current_key, previous_key])
+        current = counts.get(current_key, 0)
+        previous = counts.get(previous_key, 0)
+
+        overlap = 1 - elapsed / self.duration
+        if current + previous * overlap >= self.num_requests:
+            self.retry_after = self._retry_after(current, previous, elapsed)
+            return False
+
+        # Counters outlive their window so the next one can weigh them
+        if not self.cache.add(current_key, 1, self.duration * 2):
+            try:
+                self.cache.incr(current_key)
+            except ValueError:
+                # Expired between add and incr
+                self.cache.set(current_key, 1, self.duration * 2)
+        return True
+
+    def _retry_after(self, current, previous, elapsed) -> float:
+        # Solve for when the weighted count drops below the limit again
+        if current >= self.num_requests:
+            # This window is full; wait for it to slide far enough
+            spill = 1 - self.num_requests / current
+            return self.duration - elapsed + self.duration * spill
+        spill = 1 - (self.num_requests - current) / previous
+        return self.duration * spill - elapsed
+
+    def wait(self):
+        return max(self.retry_after, 1)
+
+
+class ClientIPThrottle(SlidingWindowThrottle):
+    """Throttle by client IP, using ``<throttle_scope>_ip`` rates."""
+
+    kind = "ip"
+
+    def get_cache_key(self, request, view):
+        return self.get_ident(request)
+
+
+class UsernameThrottle(SlidingWindowThrottle):
+    """
+    Throttle by the account a request targets, using
+    ``<throttle_scope>_username`` rates.
+
+    The username is read from the request body field named by the view's
+    ``throttle_username_field`` (``username`` by default), so one client
+    spread over many IPs still can't hammer a single account.
+    """
+
+    kind = "username"
+
+    def get_cache_key(self, request, view):
+        field = getattr(view, "throttle_username_field", "username")
+        try:
+            username = request.data.get(field)
+        except (AttributeError, ParseError, UnsupportedMediaType):
+            # Left to the view to reject; the IP throttle still applies
+            return None
+        if not isinstance(username, str) or not username.strip():
+            return None
+        # Hashed so arbitrary input can't produce invalid cache keys
+        username = username.strip().lower().encode()
+        return hashlib.sha256(username).hexdigest()[:32]
+
+
+PUBLIC_THROTTLES = [ClientIPThrottle, UsernameThrottle]
@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from iam.cache import get_blacklist_state, get_cached_user, set_blacklist_state
+
+
+class CachedRefreshToken(RefreshToken):
+    """
+    Refresh token whose blacklist state is answered from the cache first.
+
+    Notes:
+    - The token_blacklist tables remain the source of truth; a cache miss
+    falls back to them and stores the answer until the token expires.
+    - Tokens issued by ``for_user`` (token obtain) and ``outstand``
+    (rotation) are cached as not blacklisted, so their first refresh
+    skips the blacklist query.
+    - "Not blacklisted" is only cached on a shared cache backend, see
+    ``set_blacklist_state``; otherwise every check queries the database.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        set_blacklist_state(token[api_settings.JTI_CLAIM], False, token["exp"])
+        return token
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+
+        blacklisted = get_blacklist_state(jti)
+        if blacklisted is None:
+            blacklisted = BlacklistedToken.objects.filter(
+                token__jti=jti
+            ).exists()
+            set_blacklist_state(jti, blacklisted, self.payload["exp"])
+
+        if blacklisted:
+            raise TokenError(_("Token is blacklisted"))
+
+    def get_user(self):
+        """The token's user, loaded once per token through the user cache."""
+        if not hasattr(self, "_user"):
+            user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+            self._user = get_cached_user(user_id) if user_id else None
+        return self._user
+
+    def _get_or_create_outstanding(self):
+        user = self.get_user()
+
+        return OutstandingToken.objects.get_or_create(
+            jti=self.payload[api_settings.JTI_CLAIM],
+            defaults={
+                "user": user,
+                "created_at": self.current_time,
+                "token": str(self),
+                "expires_at": datetime_from_epoch(self.payload["exp"]),
+            },
+        )
+
+    def blacklist(self):
+        # The BlacklistedToken post_save receiver marks the jti in the cache
+        with transaction.atomic():
+            token, _ = self._get_or_create_outstanding()
+            return BlacklistedToken.objects.get_or_create(token=token)
+
+    def outstand(self):
+        outstanding_token, created = self._get_or_create_outstanding()
+        if created:
+            set_blacklist_state(
+                self.payload[api_settings.JTI_CLAIM],
+                False,
+                self.payload["exp"],
+            )
+        return outstanding_token, created
@@ -2,12 +2,9 @@ from typing import List, Union
 
 from django.urls import URLPattern, URLResolver, include, path
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-    TokenVerifyView,
-)
+from rest_framework_simplejwt.views import TokenRefreshView, TokenVerifyView
 
+from core.query_budget import query_budget
 from iam import views
 
 router = DefaultRouter()
@@ -20,9 +17,21 @@ router.register(
 JWT Authentication URL Endpoints
 """
 urlpatterns: List[Union[URLResolver, URLPattern]] = [
-    path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
-    path("token/verify/", TokenVerifyView.as_view(), name="token_verify"),
+    path(
+        "token/",
+        query_budget(4)(views.ThrottledTokenObtainPairView.as_view()),
+        name="token_obtain_pair",
+    ),
+    path(
+        "token/refresh/",
+        query_budget(10)(TokenRefreshView.as_view()),
+        name="token_refresh",
+    ),
+    path(
+        "token/verify/",
+        query_budget(2)(TokenVerifyView.as_view()),
+        name="token_verify",
+    ),
     path("auth/logout/", views.BlacklistRefreshView.as_view(), name="logout"),
     path(
         "",
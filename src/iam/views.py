@@ -1,29 +1,110 @@
-from typing import Type
+import json
+import logging
+from typing import Optional, Tuple, Type
 
+from celery.result import AsyncResult
+from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Prefetch, QuerySet
+from django.http import HttpResponseBase, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import md5
 from django.utils.encoding import force_bytes
-from django.utils.http import urlsafe_base64_encode
+from django.utils.http import http_date, urlsafe_base64_encode
 from rest_framework import decorators, permissions, status, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import GenericAPIView
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.serializers import BaseSerializer
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
 
 from iam import models
+from iam.cache import activation_email_cooling_down
+from iam.hashing import hash_passwords, set_user_password
 from iam.models import UserVerification
+from iam.pagination import UserKeysetPagination
 from iam.serializers import (
     AccountActivationSerializer,
+    BulkRegisterUserSerializer,
     RefreshTokenSerializer,
     RequestAccountActivationSerializer,
     RequestPasswordResetSerializer,
     ResetPasswordSerializer,
+    UserReadSerializer,
     UserSerializer,
     UserVerificationSerializer,
 )
-from notification.services import EmailService
+from iam.tasks import bulk_register_users_task
+from iam.throttling import PUBLIC_THROTTLES, ClientIPThrottle
+from iam.tokens import CachedRefreshToken
+from notification.tasks import send_reset_email
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 2000
+# UserViewSet actions served by UserReadSerializer and ?fields=
+READ_ACTIONS = ("list", "retrieve")
+
+
+def prefetch_ids(relation: str) -> Prefetch:
+    # Both user serializers only read the ids of related rows
+    related_model = models.User._meta.get_field(relation).related_model
+    return Prefetch(relation, queryset=related_model.objects.only("pk"))
+
+
+def make_etag(*parts, weak: bool = False) -> str:
+    digest = md5(
+        ":".join(map(str, parts)).encode(), usedforsecurity=False
+    ).hexdigest()
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def is_conditional(request: Request) -> bool:
+    return (
+        "HTTP_IF_NONE_MATCH" in request.META
+        or "HTTP_IF_MODIFIED_SINCE" in request.META
+    )
+
+
+def set_validators(response: HttpResponseBase, etag: str, modified_at):
+    response["ETag"] = etag
+    if modified_at is not None:
+        response["Last-Modified"] = http_date(modified_at.timestamp())
+    # Per-user admin data: clients may keep it but must revalidate
+    patch_cache_control(response, private=True, no_cache=True)
+
+
+def conditional_response(
+    request: Request, etag: str, modified_at
+) -> Optional[HttpResponseBase]:
+    """
+    The 304 (or 412) answering the request's If-None-Match/If-Modified-Since
+    headers, or None when the full response has to be sent.
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=(
+            int(modified_at.timestamp()) if modified_at is not None else None
+        ),
+    )
+    if response is not None:
+        set_validators(response, etag, modified_at)
+    return response
+
+
+class ThrottledTokenObtainPairView(TokenObtainPairView):
+    """TokenObtainPairView limited per client IP and per username."""
+
+    throttle_classes = PUBLIC_THROTTLES
+    throttle_scope = "token"
 
 
 class BlacklistRefreshView(GenericAPIView):
@@ -42,13 +123,14 @@ class BlacklistRefreshView(GenericAPIView):
     """
 
     serializer_class = RefreshTokenSerializer
+    query_budgets = {"post": 7}
 
     def post(self, request: Request) -> Response:
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         try:
-            refresh = RefreshToken(serializer.validated_data["refresh"])
+            refresh = CachedRefreshToken(serializer.validated_data["refresh"])
             refresh.blacklist()  # pyre-ignore[16]
         except (InvalidToken, TokenError):
             return Response(
@@ -72,12 +154,194 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     queryset = models.User.objects.all()
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = UserKeysetPagination
+    # Set per action on the public ones, see iam.throttling
+    throttle_scope = None
+    throttle_username_field = "username"
+    query_budgets = {
+        "list": 5,
+        "retrieve": 5,
+        "create": 5,
+        "update": 8,
+        "partial_update": 8,
+        "destroy": 12,
+        "register": 5,
+        "bulk_register": 3,
+        "bulk_register_status": 3,
+    }
+
+    def get_requested_fields(self) -> Optional[Tuple[str, ...]]:
+        """
+        The ``?fields=`` subset of UserReadSerializer.field_names, or None
+        for every field.
+        """
+        if self.action not in READ_ACTIONS:
+            return None
+        value = self.request.query_params.get("fields")
+        if not value:
+            return None
+        fields = tuple(
+            dict.fromkeys(filter(None, map(str.strip, value.split(","))))
+        )
+        if not fields:
+            raise ValidationError({"fields": "Name at least one field"})
+        unknown = set(fields) - set(UserReadSerializer.field_names)
+        if unknown:
+            raise ValidationError(
+                {"fields": f"Unknown fields: {', '.join(sorted(unknown))}"}
+            )
+        return fields
+
+    def get_queryset(self) -> QuerySet:
+        queryset = super().get_queryset()
+        fields = self.get_requested_fields()
+        if fields is None:
+            return queryset.prefetch_related(
+                *map(prefetch_ids, UserReadSerializer.related_fields)
+            )
+
+        # Load only the requested columns (the keyset pagination needs
+        # date_joined, the ETag modified_at) and prefetch only the
+        # requested relations
+        related = [f for f in fields if f in UserReadSerializer.related_fields]
+        columns = [f for f in fields if f not in related]
+        return queryset.only(
+            "date_joined", "modified_at", *columns
+        ).prefetch_related(*map(prefetch_ids, related))
+
+    def get_serializer_class(self) -> Type[BaseSerializer]:
+        # Reads skip the DRF field machinery, see UserReadSerializer
+        if self.action in READ_ACTIONS:
+            return UserReadSerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs) -> BaseSerializer:
+        if self.action in READ_ACTIONS:
+            kwargs.setdefault("fields", self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        """
+        List users, newest first, one keyset page at a time.
+
+        Query Parameters:
+        - cursor (str): Optional, the ``next`` cursor of the previous page.
+        - page_size (int): Optional, at most 500.
+        - stream (bool): Optional, stream every user as JSON lines instead
+        of a single page.
+        - fields (str): Optional, comma separated fields to return (e.g.
+        ``uuid,email,first_name``); only those columns are loaded and only
+        the requested relations prefetched.
+
+        Conditional requests (If-None-Match) are checked against the page's
+        own rows: only their keys and modified_at are read for that. There
+        is no Last-Modified, since deleting a row can move the page back in
+        time.
+        """
+        if request.query_params.get("stream") in ("1", "true"):
+            return self.stream(request)
+
+        # Reject a bad ?fields= before running any query
+        self.get_requested_fields()
+
+        if "HTTP_IF_NONE_MATCH" in request.META:
+            page = self.paginate_queryset(
+                self.filter_queryset(
+                    models.User.objects.only("date_joined", "modified_at")
+                )
+            )
+            response = conditional_response(
+                request, self.page_etag(page), None
+            )
+            if response is not None:
+                return response
+
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        response = self.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+        set_validators(response, self.page_etag(page), None)
+        return response
+
+    def page_etag(self, page) -> str:
+        # A write, insert or delete within the page changes its rows or
+        # their modified_at, and one just past it whether a next page
+        # follows; writes elsewhere leave the ETag alone
+        return make_etag(
+            *(f"{user.pk}@{user.modified_at.isoformat()}" for user in page),
+            self.paginator.has_next,
+            self.request.get_full_path(),
+            self.request.accepted_renderer.format,
+            weak=True,
+        )
+
+    def stream(self, request: Request) -> StreamingHttpResponse:
+        queryset = self.filter_queryset(self.get_queryset()).order_by(
+            *self.pagination_class.ordering
+        )
+        serializer = self.get_serializer()
+
+        def rows():
+            # iterator() keeps only one chunk (and its prefetches) in memory
+            for user in queryset.iterator(chunk_size=STREAM_CHUNK_SIZE):
+                data = serializer.to_representation(user)
+                yield json.dumps(data, cls=JSONEncoder) + "\n"
+
+        return StreamingHttpResponse(
+            rows(), content_type="application/x-ndjson"
+        )
 
     def create(self, request: Request, *args, **kwargs) -> Response:
         return super().create(request, *args, **kwargs)
 
     def retrieve(self, request: Request, *args, **kwargs) -> Response:
-        return super().retrieve(request, *args, **kwargs)
+        """
+        Retrieve one user.
+
+        Query Parameters:
+        - fields (str): Optional, comma separated fields to return.
+
+        Conditional requests (If-None-Match, If-Modified-Since) are checked
+        against the user's modified_at alone and answered with a 304 when
+        the client's copy is current.
+        """
+        user_id = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        if is_conditional(request):
+            try:
+                modified_at = (
+                    models.User.objects.filter(pk=user_id)
+                    .values_list("modified_at", flat=True)
+                    .first()
+                )
+            except DjangoValidationError:
+                # Malformed id; get_object() below answers with the 404
+                modified_at = None
+            if modified_at is not None:
+                response = conditional_response(
+                    request, self.user_etag(user_id, modified_at), modified_at
+                )
+                if response is not None:
+                    return response
+
+        user = self.get_object()
+        response = Response(self.get_serializer(user).data)
+        set_validators(
+            response,
+            self.user_etag(user.pk, user.modified_at),
+            user.modified_at,
+        )
+        return response
+
+    def user_etag(self, user_id, modified_at) -> str:
+        # The representation also depends on ?fields= and the renderer
+        return make_etag(
+            user_id,
+            modified_at.isoformat(),
+            ",".join(self.get_requested_fields() or ()),
+            self.request.accepted_renderer.format,
+        )
 
     def partial_update(self, request: Request, *args, **kwargs) -> Response:
         return super().partial_update(request, *args, **kwargs)
@@ -91,6 +355,10 @@ class UserViewSet(viewsets.ModelViewSet):
         url_path="register",
         url_name="register",
         permission_classes=[permissions.AllowAny],
+        # By IP only: a per-email limit would let anyone lock an address
+        # out of registering by spending its quota first
+        throttle_classes=[ClientIPThrottle],
+        throttle_scope="register",
     )
     def register(self, request: Request) -> Response:
         """
@@ -105,26 +373,164 @@ class UserViewSet(viewsets.ModelViewSet):
         - last_name (str): Optional.
 
         Permissions:
-        - Public (AllowAny)
+        - Public (AllowAny), throttled (429 with Retry-After over the rate)
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = serializer.save()
-        headers = self.get_success_headers(serializer.data)
+        with transaction.atomic():
+            user = serializer.save()
 
-        # generate the user activation token
-        token = default_token_generator.make_token(user)
-        UserVerification.objects.create(user=user, token=token)
+            # generate the user activation token
+            token = default_token_generator.make_token(user)
+            UserVerification.objects.create(user=user, token=token)
+        headers = self.get_success_headers(serializer.data)
 
         return Response(
             serializer.data, status=status.HTTP_201_CREATED, headers=headers
         )
 
+    @decorators.action(
+        methods=["post"],
+        detail=False,
+        url_path="bulk-register",
+        url_name="bulk-register",
+        serializer_class=BulkRegisterUserSerializer,
+    )
+    def bulk_register(self, request: Request) -> Response:
+        """
+        Register many user accounts in one request.
+
+        HTTP Method: POST
+
+        Request Body:
+        - A list of objects with email, password, first_name and last_name,
+        validated like ``register``.
+
+        Returns:
+        - 202 with the job_id of the Celery job that inserts the accepted
+        rows (see ``bulk_register_status``), and errors,
+        the index and validation errors of every rejected row.
+        - 400 with errors when no row was accepted.
+
+        Permissions:
+        - Admin only (IsAdminUser)
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response(
+                {"error": "Expected a list of users"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(rows) > settings.IAM_BULK_REGISTER_MAX_ROWS:
+            return Response(
+                {
+                    "error": "At most "
+                    f"{settings.IAM_BULK_REGISTER_MAX_ROWS} users per request"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        errors = []
+        accepted = {}
+        for index, row in enumerate(rows):
+            serializer = self.get_serializer(data=row)
+            if not serializer.is_valid():
+                errors.append({"index": index, "errors": serializer.errors})
+            elif serializer.validated_data["email"] in accepted:
+                errors.append(
+                    {
+                        "index": index,
+                        "errors": {"email": ["Duplicate email in request."]},
+                    }
+                )
+            else:
+                accepted[serializer.validated_data["email"]] = (
+                    index,
+                    serializer.validated_data,
+                )
+
+        existing = set(
+            models.User.objects.filter(email__in=accepted).values_list(
+                "email", flat=True
+            )
+        )
+        for email in existing:
+            index, _ = accepted.pop(email)
+            errors.append(
+                {
+                    "index": index,
+                    "errors": {"email": ["This field must be unique."]},
+                }
+            )
+        errors.sort(key=lambda error: error["index"])
+        if not accepted:
+            return Response(
+                {"errors": errors}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Hashed before queueing: the job's message and stored arguments
+        # only ever hold the hashes
+        accepted_rows = [
+            {"index": index, **data} for index, data in accepted.values()
+        ]
+        passwords = hash_passwords([row["password"] for row in accepted_rows])
+        for row, password in zip(accepted_rows, passwords):
+            row["password"] = password
+        job = bulk_register_users_task.delay(accepted_rows)
+        return Response(
+            {"job_id": job.id, "errors": errors},
+            status=status.HTTP_202_ACCEPTED,
+            headers={
+                "Location": reverse("user-bulk-register-status", args=[job.id])
+            },
+        )
+
+    @decorators.action(
+        methods=["get"],
+        detail=False,
+        url_path=r"bulk-register/(?P<job_id>[0-9a-f-]{36})",
+        url_name="bulk-register-status",
+    )
+    def bulk_register_status(self, request: Request, job_id: str) -> Response:
+        """
+        Report on a bulk registration job.
+
+        HTTP Method: GET
+
+        Returns:
+        - status: PENDING (queued, or an unknown id), STARTED, SUCCESS or
+        FAILURE.
+        - created / errors: once SUCCESS, the index, uuid and email of every
+        registered row, and the rows whose email was taken in the meantime.
+
+        Permissions:
+        - Admin only (IsAdminUser)
+        """
+        job = AsyncResult(job_id)
+        data = {"job_id": job_id, "status": job.state}
+        if job.successful():
+            data.update(job.result)
+        return Response(data)
+
 
 class UserVerificationViewSet(viewsets.ModelViewSet):
     queryset = UserVerification.objects.all()
     serializer_class = UserVerificationSerializer
     permission_classes = [permissions.IsAdminUser]
+    throttle_scope = None
+    throttle_username_field = "username"
+    query_budgets = {
+        "list": 2,
+        "retrieve": 2,
+        "create": 4,
+        "update": 6,
+        "partial_update": 6,
+        "destroy": 3,
+        "initiate_account_activation": 3,
+        "verify_account": 3,
+        "initiate_account_reset": 3,
+        "reset_account_password": 3,
+    }
 
     serializers_per_action = {
         "initiate_account_activation": RequestAccountActivationSerializer,
@@ -146,6 +552,8 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
         url_path="request-account-activation",
         url_name="request-account-activation",
         permission_classes=[permissions.AllowAny],
+        throttle_classes=PUBLIC_THROTTLES,
+        throttle_scope="activation",
     )
     def initiate_account_activation(self, request: Request) -> Response:
         """
@@ -157,7 +565,7 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
         - email (str): Required.
 
         Permissions:
-        - Public (AllowAny)
+        - Public (AllowAny), throttled (429 with Retry-After over the rate)
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -167,12 +575,23 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
             "user_verification_record"
         ]
 
+        if activation_email_cooling_down(user.pk):
+            # An email went out moments ago; don't rotate its token
+            return Response(
+                {"message": "Account activation email sent"},
+                status=status.HTTP_200_OK,
+            )
+
         activation_token = default_token_generator.make_token(user)
         try:
             user_verification_record.token = activation_token
-            user_verification_record.save()
-        except Exception as e:
-            print(e)
+            user_verification_record.save(
+                update_fields=["token", "modified_at"]
+            )
+        except Exception:
+            logger.exception(
+                "Could not store an activation token for user %s", user.pk
+            )
             return Response(
                 {"error": "Error sending account activation email"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -189,6 +608,8 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
         url_path="account-verify",
         url_name="account-verify",
         permission_classes=[permissions.AllowAny],
+        throttle_classes=PUBLIC_THROTTLES,
+        throttle_scope="verify",
     )
     def verify_account(self, request: Request) -> Response:
         """
@@ -200,7 +621,7 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
         - token (str): Required, activation token.
 
         Permissions:
-        - Public (AllowAny)
+        - Public (AllowAny), throttled (429 with Retry-After over the rate)
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -214,13 +635,16 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        user_verification_record.is_verified = True
-        user_verification_record.verified_at = timezone.now()
-        user_verification_record.save()
+        with transaction.atomic():
+            user_verification_record.is_verified = True
+            user_verification_record.verified_at = timezone.now()
+            user_verification_record.save(
+                update_fields=["is_verified", "verified_at", "modified_at"]
+            )
 
-        user = user_verification_record.user
-        user.is_active = True
-        user.save()
+            user = user_verification_record.user
+            user.is_active = True
+            user.save(update_fields=["is_active"])
         return Response(
             {"message": "Account verified successfully"},
             status=status.HTTP_200_OK,
@@ -232,6 +656,8 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
         url_path="request-account-reset",
         url_name="request-account-reset",
         permission_classes=[permissions.AllowAny],
+        throttle_classes=PUBLIC_THROTTLES,
+        throttle_scope="reset_request",
     )
     def initiate_account_reset(self, request: Request) -> Response:
         """
@@ -243,7 +669,7 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
         - username (str): Required, user's email.
 
         Permissions:
-        - Public (AllowAny)
+        - Public (AllowAny), throttled (429 with Retry-After over the rate)
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -256,13 +682,17 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
         reset_password_token = default_token_generator.make_token(user)
         uidb64 = urlsafe_base64_encode(force_bytes(user.uuid))
 
-        email_service = EmailService()
         try:
-            email_service.send_reset_mail(
-                user.email, uidb64, reset_password_token
-            )
-            user_verification_record.token = reset_password_token
-            user_verification_record.save()
+            with transaction.atomic():
+                user_verification_record.token = reset_password_token
+                user_verification_record.save(
+                    update_fields=["token", "modified_at"]
+                )
+                transaction.on_commit(
+                    lambda: send_reset_email.delay(
+                        user.email, uidb64, reset_password_token
+                    )
+                )
         except Exception:
             return Response(
                 {"error": "Error sending password reset email"},
@@ -279,6 +709,8 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
         url_path="account-reset",
         url_name="account-reset",
         permission_classes=[permissions.AllowAny],
+        throttle_classes=PUBLIC_THROTTLES,
+        throttle_scope="reset",
     )
     def reset_account_password(self, request: Request) -> Response:
         """
@@ -292,7 +724,7 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
         - uidb64 (str): Required, base64 encoded user UUID.
 
         Permissions:
-        - Public (AllowAny)
+        - Public (AllowAny), throttled (429 with Retry-After over the rate)
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -303,10 +735,13 @@ class UserVerificationViewSet(viewsets.ModelViewSet):
             "user_verification_record"
         ]
 
-        user.set_password(password)
-        user.save()
-        user_verification_record.token = None
-        user_verification_record.save()
+        set_user_password(user, password)
+        with transaction.atomic():
+            user.save(update_fields=["password"])
+            user_verification_record.token = None
+            user_verification_record.save(
+                update_fields=["token", "modified_at"]
+            )
         return Response(
             {"message": "Password has been reset successfully"},
             status=status.HTTP_200_OK,
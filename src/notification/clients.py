@@ -0,0 +1,172 @@
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from django.conf import settings
+from python_http_client.exceptions import HTTPError, err_dict
+from sendgrid import SendGridAPIClient
+
+MAIL_SEND_PATH = "/v3/mail/send"
+# How a send on a keep-alive connection the server has since closed fails
+# (RemoteDisconnected is a ConnectionResetError)
+STALE_CONNECTION_ERRORS = (BrokenPipeError, ConnectionResetError)
+
+
+class SendGridResponse:
+    def __init__(self, status_code: int, body: bytes, headers):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers
+
+
+class PooledSendGridClient(SendGridAPIClient):
+    """
+    SendGrid client that keeps a bounded pool of keep-alive HTTPS
+    connections, so consecutive sends skip the TCP and TLS handshakes.
+
+    Notes:
+    - Safe to share between threads; each send checks out its own
+    connection.
+    - A pooled connection the server closed before replying is retried
+    once, on a fresh connection. Nothing else is retried: after a timeout
+    SendGrid may already have accepted the mail.
+    """
+
+    def __init__(self, api_key=None, pool_size=10, timeout=10, **kwargs):
+        super().__init__(api_key, **kwargs)
+        self.netloc = urlparse(self.host).netloc
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> http.client.HTTPSConnection:
+        return http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _release(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def _post(self, body: bytes, headers: dict):
+        connection, reused = self._acquire()
+        try:
+            return self._request(connection, body, headers)
+        except STALE_CONNECTION_ERRORS:
+            if not reused:
+                raise
+        # The server dropped an idle keep-alive connection without reading
+        # the request
+        return self._request(self._connect(), body, headers)
+
+    def _request(self, connection, body: bytes, headers: dict):
+        try:
+            connection.request("POST", MAIL_SEND_PATH, body, headers)
+            response = connection.getresponse()
+            payload = response.read()
+        except BaseException:
+            connection.close()
+            raise
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        return response, payload
+
+    def send(self, message):
+        if not isinstance(message, dict):
+            message = message.get()
+
+        headers = {**self._default_headers, "Content-Type": "application/json"}
+        response, payload = self._post(
+            json.dumps(message).encode("utf-8"), headers
+        )
+        if response.status >= 400:
+            error_class = err_dict.get(response.status, HTTPError)
+            raise error_class(
+                response.status, response.reason, payload, response.headers
+            )
+        return SendGridResponse(response.status, payload, response.headers)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class FakeSendGridClient:
+    """
+    Transport that accepts every message without touching the network,
+    for load tests and local runs without a SendGrid key.
+
+    Notes:
+    - ``latency`` seconds are slept per send to stand in for the API
+    round trip.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.sent += 1
+        return SendGridResponse(202, b"", {})
+
+    def close(self):
+        pass
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_sendgrid_client() -> PooledSendGridClient:
+    """Return the process-wide SendGrid client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PooledSendGridClient(
+                    settings.SENDGRID_API_KEY,
+                    pool_size=settings.SENDGRID_POOL_SIZE,
+                    timeout=settings.SENDGRID_TIMEOUT,
+                )
+    return _client
+
+
+@contextmanager
+def use_sendgrid_client(client):
+    """Make ``client`` the process-wide SendGrid client for the block."""
+    global _client
+    previous, _client = _client, client
+    try:
+        yield client
+    finally:
+        _client = previous
+
+
+def _reset_client():
+    # Sockets must not be shared with forked gunicorn/celery children
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_client)
@@ -0,0 +1,45 @@
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+
+from notification.rendering import get_email_template
+
+TEMPLATES = (
+    ("emails/activation_email.html", "activation_url"),
+    ("emails/reset_password_email.html", "reset_url"),
+)
+
+
+class Command(BaseCommand):
+    help = "Compare renders/sec of render_to_string and compiled templates"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        for template_name, variable in TEMPLATES:
+            urls = [
+                f"{settings.FRONTEND_APP_URL}/login?"
+                + urlencode({"action": "activate", "token": f"token-{i}"})
+                for i in range(iterations)
+            ]
+
+            start = time.perf_counter()
+            for url in urls:
+                render_to_string(template_name, {variable: url})
+            baseline = iterations / (time.perf_counter() - start)
+
+            template = get_email_template(template_name, variable)
+            start = time.perf_counter()
+            for url in urls:
+                template.render(url)
+            compiled = iterations / (time.perf_counter() - start)
+
+            self.stdout.write(
+                f"{template_name}: render_to_string {baseline:,.0f}/s, "
+                f"compiled {compiled:,.0f}/s ({compiled / baseline:.1f}x)"
+            )
@@ -0,0 +1,47 @@
+import time
+
+from celery import current_app
+from celery.app.trace import build_tracer
+from celery.utils import uuid
+from django.core.management.base import BaseCommand
+from django_celery_results.models import TaskResult
+
+from notification.tasks import sample_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare worker-side task throughput with and without writing "
+        "results to the django-db result backend"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tasks", type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = options["tasks"]
+        # The tracer is what a worker runs for each message, result
+        # storage included; only the broker round trip is left out.
+        tracer = build_tracer(sample_task.name, sample_task, app=current_app)
+        task_ids = []
+        for label, ignore_result in (
+            ("ignore_result", True),
+            ("django-db result", False),
+        ):
+            start = time.perf_counter()
+            for _ in range(count):
+                task_id = uuid()
+                task_ids.append(task_id)
+                tracer(
+                    task_id,
+                    ("bench",),
+                    {},
+                    {"id": task_id, "ignore_result": ignore_result},
+                )
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label}: {count / elapsed:,.0f} tasks/s "
+                f"({elapsed / count * 1000:.3f}ms per task)"
+            )
+
+        TaskResult.objects.filter(task_id__in=task_ids).delete()
@@ -0,0 +1,54 @@
+from functools import lru_cache
+from typing import List
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils.html import escape
+
+try:
+    from premailer import transform as inline_css
+except ImportError:  # pragma: no cover - premailer is optional
+    inline_css = None
+
+
+class CompiledEmailTemplate:
+    """
+    An email template rendered once with a placeholder for its single
+    per-recipient variable, then split around it.
+
+    Rendering afterwards is a string join, with the value HTML-escaped the
+    same way Django's autoescaping would.
+
+    Notes:
+    - Only suitable for templates whose output depends on nothing but
+    ``variable`` (no conditionals or filters on it).
+    """
+
+    def __init__(self, template_name: str, variable: str):
+        self.template_name = template_name
+        self.variable = variable
+        self.placeholder = f"__{variable.upper()}__"
+
+        content = get_template(template_name).render(
+            {variable: self.placeholder}
+        )
+        if settings.EMAIL_INLINE_CSS and inline_css is not None:
+            content = inline_css(content)
+
+        self.parts: List[str] = content.split(self.placeholder)
+
+    @property
+    def source(self) -> str:
+        """The rendered template with the placeholder left in place."""
+        return self.placeholder.join(self.parts)
+
+    def render(self, value: str) -> str:
+        return escape(value).join(self.parts)
+
+
+@lru_cache(maxsize=None)
+def get_email_template(
+    template_name: str, variable: str
+) -> CompiledEmailTemplate:
+    """Return the compiled template, building it once per process."""
+    return CompiledEmailTemplate(template_name, variable)
@@ -1,19 +1,30 @@
 # notifications/services.py
 
 import logging
+from typing import Dict, Iterable, List, Tuple
 from urllib.parse import urlencode
 
 from django.conf import settings
-from django.template.loader import render_to_string
-from sendgrid import SendGridAPIClient
+from django.utils.html import escape
 from sendgrid.helpers.mail import Mail
 
+from notification.clients import PooledSendGridClient, get_sendgrid_client
+from notification.rendering import get_email_template
+
 logger = logging.getLogger(__name__)
 
 
 class EmailService:
-    def __init__(self, api_key=settings.SENDGRID_API_KEY):
-        self.client = SendGridAPIClient(api_key)
+    def __init__(self, api_key=None, client=None):
+        # ``client`` lets callers (and tests) swap in a fake transport that
+        # exposes the same ``send(message)`` method as SendGridAPIClient.
+        if client is None:
+            client = (
+                PooledSendGridClient(api_key)
+                if api_key
+                else get_sendgrid_client()
+            )
+        self.client = client
 
     def send_email(self, to_email: str, subject: str, content: str):
         message = Mail(
@@ -25,19 +36,80 @@ class EmailService:
         response = self.client.send(message)
         return response
 
+    def send_bulk(
+        self,
+        recipients: Iterable[Tuple[str, Dict[str, str]]],
+        subject: str,
+        content: str,
+    ) -> List:
+        """
+        Send one message to many recipients, packing up to
+        SENDGRID_BATCH_SIZE personalizations into each API call.
+
+        ``recipients`` yields ``(email, substitutions)`` pairs; every
+        substitution key found in ``content`` is replaced per recipient
+        by SendGrid.
+        """
+        batch_size = settings.SENDGRID_BATCH_SIZE
+        responses = []
+        personalizations = []
+        for to_email, substitutions in recipients:
+            personalizations.append(
+                {
+                    "to": [{"email": to_email}],
+                    "substitutions": substitutions,
+                }
+            )
+            if len(personalizations) == batch_size:
+                responses.append(
+                    self._send_batch(personalizations, subject, content)
+                )
+                personalizations = []
+        if personalizations:
+            responses.append(
+                self._send_batch(personalizations, subject, content)
+            )
+        return responses
+
+    def _send_batch(self, personalizations, subject: str, content: str):
+        message = {
+            "from": {"email": settings.SENDGRID_SENDER_EMAIL},
+            "subject": subject,
+            "content": [{"type": "text/html", "value": content}],
+            "personalizations": personalizations,
+        }
+        return self.client.send(message)
+
     def send_activation_mail(self, to_email: str, token: str):
         subject = "Activate your account"
+        url = self._activation_url(token)
+        content = get_email_template(
+            "emails/activation_email.html", "activation_url"
+        ).render(url)
+        return self.send_email(to_email, subject, content)
+
+    def _activation_url(self, token: str) -> str:
         params = {
             "action": "activate",
             "token": token,
         }
-        url = f"{settings.FRONTEND_APP_URL}/login?{urlencode(params)}"
+        logger.debug(params)
+        return f"{settings.FRONTEND_APP_URL}/login?{urlencode(params)}"
 
-        content = render_to_string(
-            "emails/activation_email.html", {"activation_url": url}
+    def send_bulk_activation_mail(self, recipients: Iterable[Tuple[str, str]]):
+        """Send activation emails for many ``(email, token)`` pairs."""
+        subject = "Activate your account"
+        template = get_email_template(
+            "emails/activation_email.html", "activation_url"
         )
-        logger.debug(params)
-        return self.send_email(to_email, subject, content)
+        substitutions = (
+            (
+                to_email,
+                {template.placeholder: escape(self._activation_url(token))},
+            )
+            for to_email, token in recipients
+        )
+        return self.send_bulk(substitutions, subject, template.source)
 
     def send_reset_mail(self, to_email: str, uidb64: str, token: str):
         subject = "Reset your password"
@@ -47,8 +119,8 @@ class EmailService:
             "token": token,
         }
         url = f"{settings.FRONTEND_APP_URL}/login?{urlencode(params)}"
-        content = render_to_string(
-            "emails/reset_password_email.html", {"reset_url": url}
-        )
+        content = get_email_template(
+            "emails/reset_password_email.html", "reset_url"
+        ).render(url)
         logger.debug(params)
         return self.send_email(to_email, subject, content)
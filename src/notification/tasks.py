@@ -1,12 +1,109 @@
 import logging
+from contextlib import contextmanager
+from urllib.error import URLError
+
 from celery import shared_task
+from python_http_client.exceptions import HTTPError
+
+from notification.services import EmailService
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task(name="sample_task")
+class TransientEmailError(Exception):
+    """SendGrid answered 429 or 5xx; the send is worth another attempt."""
+
+
+# Errors raised by the SendGrid transport that are worth another attempt:
+# rate limiting, API-side failures and network/TLS hiccups. Any other 4xx
+# (bad payload, revoked key, ...) fails on the first attempt.
+RETRYABLE_EMAIL_ERRORS = (
+    TransientEmailError,
+    URLError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+@contextmanager
+def transient_http_errors():
+    """Re-raise 429 and 5xx SendGrid responses as TransientEmailError."""
+    try:
+        yield
+    except HTTPError as e:
+        if e.status_code == 429 or e.status_code >= 500:
+            raise TransientEmailError(
+                f"SendGrid answered {e.status_code}"
+            ) from e
+        raise
+
+
+# Nobody reads the outcome of a send, so none of these tasks write a
+# TaskResult row; failures still show up in the worker logs. The sends are
+# acknowledged only once they finish: a worker lost mid-send may deliver an
+# email twice, rather than never.
+
+
+@shared_task(name="sample_task", ignore_result=True)
 def sample_task(name="World"):
     """A simple task that says hello."""
     message = f"Hello, {name}!"
     logger.info(message)
     return message
+
+
+@shared_task(
+    name="send_activation_email",
+    ignore_result=True,
+    acks_late=True,
+    autoretry_for=RETRYABLE_EMAIL_ERRORS,
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True,
+    max_retries=5,
+)
+def send_activation_email(to_email: str, token: str):
+    """Deliver the account activation email outside the request thread."""
+    with transient_http_errors():
+        response = EmailService().send_activation_mail(to_email, token)
+    return response.status_code
+
+
+@shared_task(
+    name="send_reset_email",
+    ignore_result=True,
+    acks_late=True,
+    autoretry_for=RETRYABLE_EMAIL_ERRORS,
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True,
+    max_retries=5,
+)
+def send_reset_email(to_email: str, uidb64: str, token: str):
+    """Deliver the password reset email outside the request thread."""
+    with transient_http_errors():
+        response = EmailService().send_reset_mail(to_email, uidb64, token)
+    return response.status_code
+
+
+@shared_task(
+    name="send_activation_emails",
+    ignore_result=True,
+    acks_late=True,
+    autoretry_for=RETRYABLE_EMAIL_ERRORS,
+    retry_backoff=True,
+    retry_backoff_max=600,
+    retry_jitter=True,
+    max_retries=5,
+)
+def send_activation_emails(recipients):
+    """
+    Deliver activation emails for a batch of ``[email, token]`` pairs in as
+    few SendGrid calls as possible.
+
+    Callers should keep each batch within SENDGRID_BATCH_SIZE so a retry
+    never re-sends an already delivered API call.
+    """
+    with transient_http_errors():
+        responses = EmailService().send_bulk_activation_mail(recipients)
+    return [response.status_code for response in responses]
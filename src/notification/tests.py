@@ -0,0 +1,234 @@
+import http.client
+from unittest import mock
+
+from celery.exceptions import Retry
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from python_http_client.exceptions import HTTPError, err_dict
+from rest_framework.test import APIClient
+
+from iam.models import User, UserVerification
+from notification.clients import (
+    FakeSendGridClient,
+    PooledSendGridClient,
+    use_sendgrid_client,
+)
+from notification.tasks import (
+    TransientEmailError,
+    send_activation_email,
+    send_reset_email,
+)
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True, CELERY_TASK_EAGER_PROPAGATES=True
+)
+class EagerEmailTestCase(TestCase):
+    """Runs tasks inline and sends through a fake SendGrid transport."""
+
+    def setUp(self):
+        self.transport = FakeSendGridClient()
+        self.enterContext(use_sendgrid_client(self.transport))
+
+
+class SendActivationEmailTests(EagerEmailTestCase):
+    def test_task_sends_one_email(self):
+        send_activation_email.delay("user@example.com", "token")
+        self.assertEqual(self.transport.sent, 1)
+
+    def test_new_verification_sends_once_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                user = User.objects.create(
+                    username="user@example.com", email="user@example.com"
+                )
+                UserVerification.objects.create(user=user, token="token")
+            self.assertEqual(self.transport.sent, 0)
+
+        self.assertEqual(self.transport.sent, 1)
+
+    def test_save_without_new_token_sends_nothing(self):
+        user = User.objects.create(
+            username="user@example.com", email="user@example.com"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            verification = UserVerification.objects.create(
+                user=user, token="token"
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            verification.is_verified = True
+            verification.save(update_fields=["is_verified", "modified_at"])
+
+        self.assertEqual(self.transport.sent, 1)
+
+    def test_rolled_back_verification_sends_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                user = User.objects.create(
+                    username="user@example.com", email="user@example.com"
+                )
+                UserVerification.objects.create(user=user, token="token")
+                raise RuntimeError
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.transport.sent, 0)
+
+
+class SendResetEmailTests(EagerEmailTestCase):
+    def test_reset_request_sends_once_on_commit(self):
+        user = User.objects.create(
+            username="user@example.com",
+            email="user@example.com",
+            is_active=True,
+        )
+        UserVerification.objects.create(user=user, is_verified=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post(
+                reverse("user-verification-request-account-reset"),
+                {"username": "user@example.com"},
+                format="json",
+            )
+            self.assertEqual(self.transport.sent, 0)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.transport.sent, 1)
+
+
+class FailingSendGridClient(FakeSendGridClient):
+    """Answers every send with the given HTTP error status."""
+
+    def __init__(self, status: int):
+        super().__init__()
+        self.status = status
+        self.attempts = 0
+
+    def send(self, message):
+        self.attempts += 1
+        error_class = err_dict.get(self.status, HTTPError)
+        raise error_class(self.status, "error", b"{}", {})
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True, CELERY_TASK_EAGER_PROPAGATES=True
+)
+class EmailRetryTests(TestCase):
+    def send_with(self, status: int) -> mock.Mock:
+        """Send through a transport answering ``status``; return retry()."""
+        retry = mock.Mock(side_effect=Retry)
+        with use_sendgrid_client(FailingSendGridClient(status)):
+            with mock.patch.object(send_reset_email, "retry", retry):
+                with self.assertRaises((HTTPError, Retry)):
+                    send_reset_email.delay("user@example.com", "uid", "t")
+        return retry
+
+    def test_client_errors_fail_on_the_first_attempt(self):
+        for status in (400, 401, 403, 413):
+            with self.subTest(status=status):
+                self.send_with(status).assert_not_called()
+
+    def test_rate_limits_and_server_errors_are_retried(self):
+        for status in (429, 500, 503):
+            with self.subTest(status=status):
+                retry = self.send_with(status)
+                retry.assert_called_once()
+                self.assertIsInstance(
+                    retry.call_args.kwargs["exc"], TransientEmailError
+                )
+
+
+class StubResponse:
+    status = 202
+    reason = "Accepted"
+    headers = {}
+    will_close = False
+
+    def read(self):
+        return b""
+
+
+class StubConnection:
+    """HTTPSConnection stand-in that fails with ``error``, if given."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.requests = 0
+        self.closed = False
+
+    def request(self, method, url, body, headers):
+        self.requests += 1
+        if self.error is not None:
+            raise self.error
+
+    def getresponse(self):
+        return StubResponse()
+
+    def close(self):
+        self.closed = True
+
+
+class PooledSendGridClientTests(SimpleTestCase):
+    def setUp(self):
+        self.client = PooledSendGridClient("key", pool_size=4)
+        self.fresh = []
+        self.client._connect = self.connect
+
+    def connect(self, error=None):
+        connection = StubConnection(error)
+        self.fresh.append(connection)
+        return connection
+
+    def pool(self, *connections):
+        for connection in connections:
+            self.client._pool.put_nowait(connection)
+
+    def send(self):
+        return self.client.send({"subject": "hello"})
+
+    def test_connections_are_reused(self):
+        self.send()
+        self.send()
+        self.assertEqual(len(self.fresh), 1)
+        self.assertEqual(self.fresh[0].requests, 2)
+
+    def test_stale_pooled_connection_is_retried_once_on_a_fresh_one(self):
+        for error in (
+            http.client.RemoteDisconnected(),
+            BrokenPipeError(),
+            ConnectionResetError(),
+        ):
+            with self.subTest(error=type(error).__name__):
+                self.fresh.clear()
+                stale = StubConnection(error)
+                self.pool(stale)
+                self.assertEqual(self.send().status_code, 202)
+                self.assertTrue(stale.closed)
+                self.assertEqual(len(self.fresh), 1)
+                self.client.close()
+
+    def test_retry_skips_the_other_pooled_connections(self):
+        stale = [StubConnection(ConnectionResetError()) for _ in range(3)]
+        self.pool(*stale)
+        self.client._connect = lambda: self.connect(ConnectionResetError())
+
+        with self.assertRaises(ConnectionResetError):
+            self.send()
+        self.assertEqual(sum(c.requests for c in stale), 1)
+        self.assertEqual(len(self.fresh), 1)
+
+    def test_timeout_is_not_retried(self):
+        pooled = StubConnection(TimeoutError())
+        self.pool(pooled)
+
+        with self.assertRaises(TimeoutError):
+            self.send()
+        self.assertTrue(pooled.closed)
+        self.assertEqual(self.fresh, [])
+
+    def test_error_on_a_fresh_connection_is_not_retried(self):
+        self.client._connect = lambda: self.connect(ConnectionResetError())
+
+        with self.assertRaises(ConnectionResetError):
+            self.send()
+        self.assertEqual(len(self.fresh), 1)